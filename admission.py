@@ -0,0 +1,254 @@
+"""
+Control de admisión por tenant para el tráfico de scoring.
+
+Cada tenant (X-Tenant-ID) tiene un token bucket y un tope de concurrencia,
+configurables en su JSON de institución bajo "admission_control". Cuando no
+hay slot libre, la petición entra en una cola justa ponderada (WFQ) de
+profundidad acotada: al liberarse un slot se despacha al tenant elegible con
+menor etiqueta virtual, así un lote masivo de un banco no deja sin turno a
+las evaluaciones interactivas de los demás. Lo que no puede atenderse dentro
+de su deadline se rechaza al momento con 429/503 y Retry-After.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+
+# --- CONFIGURACIÓN ---
+DEFAULT_LIMITS = {
+    "rate_per_second": 100.0,    # reposición del token bucket
+    "burst": 200,                # capacidad del bucket
+    "max_concurrency": 16,       # evaluaciones simultáneas del tenant
+    "max_queue": 100,            # peticiones del tenant esperando slot
+    "weight": 1.0                # peso en la cola justa
+}
+MAX_CONCURRENT_SCORING = 64      # slots de scoring compartidos por todos los tenants
+MAX_QUEUE_DEPTH = 1000           # peticiones en cola entre todos los tenants
+INTERACTIVE_DEADLINE = 2.0       # espera máxima (s) de /assess-credit antes de 503
+BATCH_DEADLINE = 10.0
+BATCH_COST = 20.0                # un lote avanza la etiqueta virtual como 20 evaluaciones
+SERVICE_TIME_ALPHA = 0.1         # suavizado de la media móvil del tiempo en slot
+INITIAL_SERVICE_TIME = 0.01
+
+
+class AdmissionRejected(Exception):
+    """Petición rechazada antes de consumir un slot de scoring"""
+
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class Waiter:
+    __slots__ = ("tag", "cost", "future")
+
+    def __init__(self, tag, cost, future):
+        self.tag = tag
+        self.cost = cost
+        self.future = future
+
+
+class TenantState:
+    """Token bucket, concurrencia, cola y contadores de un tenant"""
+
+    __slots__ = ("key", "limits", "tokens", "updated", "in_flight", "queue", "last_tag", "counters")
+
+    def __init__(self, key, limits):
+        self.key = key
+        self.limits = limits
+        self.tokens = float(limits["burst"])
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.queue = deque()
+        self.last_tag = 0.0
+        self.counters = {"admitted": 0, "queued": 0, "rate_limited": 0, "queue_full": 0, "deadline": 0}
+
+    def refill(self, now):
+        rate = self.limits["rate_per_second"]
+        self.tokens = min(float(self.limits["burst"]), self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def has_capacity(self):
+        return self.in_flight < self.limits["max_concurrency"]
+
+
+class AdmissionController:
+    """Token bucket + tope de concurrencia por tenant sobre una cola justa ponderada global"""
+
+    def __init__(self, capacity=MAX_CONCURRENT_SCORING, max_queue=MAX_QUEUE_DEPTH):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queued = 0
+        self.virtual_time = 0.0
+        self.service_time = INITIAL_SERVICE_TIME
+        self.tenants = {}
+
+    def limits_for(self, institution):
+        configured = institution.config.get("admission_control", {}) if institution is not None else {}
+        return {**DEFAULT_LIMITS, **configured}
+
+    def tenant(self, key, institution):
+        state = self.tenants.get(key)
+        if state is None:
+            state = self.tenants[key] = TenantState(key, self.limits_for(institution))
+        else:
+            # límites recargados en caliente junto con el JSON de la institución
+            state.limits = self.limits_for(institution)
+        return state
+
+    # --- ADMISIÓN ---
+    async def acquire(self, key, institution=None, cost=1.0, deadline=INTERACTIVE_DEADLINE):
+        """Espera un slot o lanza AdmissionRejected; devuelve el estado del tenant para `release`"""
+        state = self.tenant(key, institution)
+        now = time.monotonic()
+
+        state.refill(now)
+        if state.tokens < 1.0:
+            state.counters["rate_limited"] += 1
+            raise AdmissionRejected(429, f"Límite de peticiones excedido para '{key}'",
+                                    (1.0 - state.tokens) / max(state.limits["rate_per_second"], 1e-9))
+
+        # el token y la etiqueta solo se consumen si la petición entra o queda en cola:
+        # un rechazo por cola llena o por plazo no debe penalizar al tenant
+        tag = max(self.virtual_time, state.last_tag) + cost / max(state.limits["weight"], 1e-9)
+
+        if self.in_flight < self.capacity and state.has_capacity():
+            # con slots libres no hay nadie despachable esperando: entra directo
+            state.tokens -= 1.0
+            state.last_tag = tag
+            self._grant(state)
+            self.virtual_time = max(self.virtual_time, tag - cost / max(state.limits["weight"], 1e-9))
+            return state
+
+        if len(state.queue) >= state.limits["max_queue"] or self.queued >= self.max_queue:
+            state.counters["queue_full"] += 1
+            raise AdmissionRejected(503, "Cola de evaluación llena", self.estimated_wait())
+
+        wait = self.estimated_wait(tag)
+        if wait >= deadline:
+            # mejor un rechazo inmediato que una espera que igual vencería
+            state.counters["deadline"] += 1
+            raise AdmissionRejected(503, "Evaluación no atendible dentro del plazo", wait)
+
+        state.tokens -= 1.0
+        state.last_tag = tag
+        waiter = Waiter(tag, cost, asyncio.get_event_loop().create_future())
+        state.queue.append(waiter)
+        state.counters["queued"] += 1
+        self.queued += 1
+        try:
+            await asyncio.wait_for(waiter.future, deadline)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # el slot llegó junto con el timeout o la desconexión: se devuelve
+                self.release(state)
+            else:
+                self._discard(state, waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            state.counters["deadline"] += 1
+            raise AdmissionRejected(503, "Evaluación no atendible dentro del plazo", self.estimated_wait())
+        return state
+
+    def release(self, state, held=None):
+        """Libera el slot del tenant y despacha al siguiente según la cola justa"""
+        state.in_flight -= 1
+        self.in_flight -= 1
+        if held is not None:
+            self.service_time += SERVICE_TIME_ALPHA * (held - self.service_time)
+        self._dispatch()
+
+    async def hold(self, chunks, state, started):
+        """Mantiene el slot mientras se consume una respuesta en streaming (lotes).
+
+        `started` es el `time.perf_counter()` de la admisión: el tiempo retenido entra en
+        `service_time`, así la espera estimada refleja los slots ocupados por lotes."""
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            self.release(state, time.perf_counter() - started)
+
+    def _grant(self, state):
+        state.in_flight += 1
+        self.in_flight += 1
+        state.counters["admitted"] += 1
+
+    def _discard(self, state, waiter):
+        try:
+            state.queue.remove(waiter)
+            self.queued -= 1
+        except ValueError:
+            pass
+
+    def _dispatch(self):
+        while self.in_flight < self.capacity and self.queued:
+            best = None
+            for state in self.tenants.values():
+                if state.queue and state.has_capacity() and (best is None or state.queue[0].tag < best.queue[0].tag):
+                    best = state
+            if best is None:
+                return
+            waiter = best.queue.popleft()
+            self.queued -= 1
+            if waiter.future.done():
+                continue
+            self.virtual_time = max(self.virtual_time, waiter.tag - waiter.cost / max(best.limits["weight"], 1e-9))
+            self._grant(best)
+            waiter.future.set_result(True)
+
+    def estimated_wait(self, tag=None):
+        """Espera estimada: turnos por delante en la cola justa × tiempo medio en slot"""
+        if tag is None:
+            ahead = self.queued
+        else:
+            # solo se cuentan las esperas con etiqueta menor: el tenant liviano no paga la cola del pesado
+            ahead = sum(1 for state in self.tenants.values() for waiter in state.queue if waiter.tag < tag)
+        return (ahead + 1) / self.capacity * self.service_time
+
+    # --- OBSERVABILIDAD ---
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "service_time_ms": round(self.service_time * 1000, 3),
+            "tenants": {
+                key: {
+                    "in_flight": state.in_flight,
+                    "queue_depth": len(state.queue),
+                    "tokens": round(state.tokens, 2),
+                    "limits": state.limits,
+                    **state.counters
+                }
+                for key, state in self.tenants.items()
+            }
+        }
+
+    def prometheus(self):
+        lines = [
+            "# HELP admission_queue_depth Peticiones esperando slot de scoring",
+            "# TYPE admission_queue_depth gauge",
+        ]
+        lines += [f'admission_queue_depth{{tenant="{key}"}} {len(state.queue)}' for key, state in self.tenants.items()]
+        lines += [
+            "# HELP admission_in_flight Evaluaciones en curso por tenant",
+            "# TYPE admission_in_flight gauge",
+        ]
+        lines += [f'admission_in_flight{{tenant="{key}"}} {state.in_flight}' for key, state in self.tenants.items()]
+        lines += [
+            "# HELP admission_rejected_total Peticiones rechazadas por control de admisión",
+            "# TYPE admission_rejected_total counter",
+        ]
+        for key, state in self.tenants.items():
+            for reason in ("rate_limited", "queue_full", "deadline"):
+                lines.append(f'admission_rejected_total{{tenant="{key}",reason="{reason}"}} {state.counters[reason]}')
+        return lines
+
+
+admission = AdmissionController()
@@ -0,0 +1,379 @@
+"""
+Orquestador multi-agente para /assess-credit.
+
+Cada agente es un scorer enchufable con su propio deadline, peso y score de
+respaldo. Los agentes se lanzan todos a la vez: los ligeros o de I/O corren
+como corutinas en el event loop, y los de CPU en un pool de procesos cuyos
+workers precargan los motores de los tenants. Si un agente no responde a
+tiempo se usa su respaldo, así que la latencia total queda acotada por el
+agente más lento que se espera y no por la suma de todos. Las fórmulas son
+vectorizadas: /assess-credit/batch combina los mismos agentes, con los
+mismos pesos y respaldos, sobre bloques completos (`assess_batch`).
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi.concurrency import run_in_threadpool
+
+from metrics import Histogram, LATENCY_BUCKETS
+from startup import lazy_module
+
+np = lazy_module("numpy")
+risk_aggregates = lazy_module("risk_aggregates")
+scoring_engine = lazy_module("scoring_engine")
+
+# --- CONFIGURACIÓN ---
+PROCESS_POOL_WORKERS = min(2, os.cpu_count() or 1)
+FRAUD_Z_THRESHOLD = 3.0
+FRAUD_FLAGS = ("edad", "ingresos", "score_crediticio", "monto_vs_ingresos")
+MAX_INSTALLMENT_BURDEN = 0.5   # cuota/ingreso a partir de la cual el riesgo por ingresos es máximo
+MAX_DEBT_TO_INCOME = 0.6
+NUMERIC_FIELDS = ("age", "monthly_income", "credit_score", "debt_to_income_ratio", "late_payments",
+                  "loan_amount", "loan_term_months")
+
+
+# --- LOTES DE SOLICITANTES ---
+def as_batch(columns, prior=None):
+    """Columnas de solicitantes (listas o arrays) como arrays float; los campos faltantes quedan en NaN"""
+    n = len(columns["city"])
+    batch = {
+        # None (campo opcional ausente) se convierte en NaN
+        name: np.asarray(columns[name], dtype=np.float64) if columns.get(name) is not None else np.full(n, np.nan)
+        for name in NUMERIC_FIELDS
+    }
+    batch["city"] = list(columns["city"])
+    batch["prior"] = prior
+    return batch
+
+
+def request_batch(request):
+    """Un body de /assess-credit como lote de una fila, con las mismas columnas que el masivo"""
+    values = {**request["applicant"], "loan_amount": request.get("loan_amount"),
+              "loan_term_months": request.get("loan_term_months")}
+    return as_batch({name: [values.get(name)] for name in (*NUMERIC_FIELDS, "city")})
+
+
+def combine(weights, risks):
+    """Promedio ponderado de los riesgos por agente (escalares o arrays alineados)"""
+    total = sum(weights)
+    return sum(w * r for w, r in zip(weights, risks)) / total if total else 0.0 * risks[0]
+
+
+def _item(value):
+    value = value.item() if hasattr(value, "item") else value
+    return round(value, 4) if isinstance(value, float) else value
+
+
+# --- AGENTES ---
+class Agent:
+    """Scorer enchufable y vectorizado: la misma fórmula sirve a /assess-credit y al masivo"""
+
+    name = ""
+    specialization = ""
+    mode = "async"          # async | thread | process
+    weight = 1.0
+    deadline_ms = 50.0
+    fallback_score = 0.5
+
+    def evaluate(self, engine, batch):
+        """(riesgo [0, 1] por fila, NaN si no hay datos; detalle por fila como arrays)"""
+        raise NotImplementedError
+
+    def explain(self, detail, i):
+        return {name: _item(values[i]) for name, values in detail.items()}
+
+    def fallback(self, engine):
+        """Riesgo que se usa si el agente no tiene datos, no responde a tiempo o falla"""
+        return engine.base_rate if self.fallback_score is None else self.fallback_score
+
+    async def score(self, ctx):
+        risk, detail = self.evaluate(ctx["engine"], ctx["batch"])
+        if np.isnan(risk[0]):
+            return None
+        return float(risk[0]), self.explain(detail, 0)
+
+    def describe(self):
+        return {
+            "agent": self.name,
+            "specialization": self.specialization,
+            "mode": self.mode,
+            "weight": self.weight,
+            "deadline_ms": self.deadline_ms
+        }
+
+
+class IncomeAgent(Agent):
+    name = "Agent Alpha"
+    specialization = "Análisis de Ingresos"
+    weight = 0.15
+    fallback_score = 0.5
+
+    def evaluate(self, engine, batch):
+        installment = batch["loan_amount"] / np.maximum(batch["loan_term_months"], 1)
+        burden = installment / np.maximum(batch["monthly_income"], 1.0)
+        return np.clip(burden / MAX_INSTALLMENT_BURDEN, 0.0, 1.0), {"installment_to_income": burden}
+
+
+class CreditHistoryAgent(Agent):
+    name = "Agent Beta"
+    specialization = "Historial Crediticio"
+    weight = 0.20
+    fallback_score = 0.5
+
+    def evaluate(self, engine, batch):
+        late_payments = np.nan_to_num(batch["late_payments"], nan=0.0)
+        risk = (850 - batch["credit_score"]) / 550 + 0.05 * late_payments
+        return np.clip(risk, 0.0, 1.0), {
+            "credit_score": batch["credit_score"].astype(np.int64),
+            "late_payments": late_payments.astype(np.int64)
+        }
+
+
+class TransactionalAgent(Agent):
+    name = "Agent Gamma"
+    specialization = "Comportamiento Transaccional"
+    weight = 0.10
+    fallback_score = 0.5
+
+    def evaluate(self, engine, batch):
+        ratio = batch["debt_to_income_ratio"]
+        return np.clip(ratio / MAX_DEBT_TO_INCOME, 0.0, 1.0), {"debt_to_income_ratio": ratio}
+
+
+class DemographicAgent(Agent):
+    name = "Agent Delta"
+    specialization = "Análisis Demográfico"
+    weight = 0.05
+    fallback_score = 0.5
+
+    def evaluate(self, engine, batch):
+        rate = engine.city_rates(batch["city"])
+        return np.clip(rate, 0.0, 1.0), {"city_default_rate": rate}
+
+
+class FraudAgent(Agent):
+    name = "Agent Epsilon"
+    specialization = "Detección de Fraude"
+    weight = 0.05
+    fallback_score = 0.5
+
+    def evaluate(self, engine, batch):
+        z = engine.encode(batch["age"], batch["monthly_income"], batch["credit_score"])
+        flags = np.column_stack([np.abs(z) > FRAUD_Z_THRESHOLD,
+                                 batch["loan_amount"] > 60 * batch["monthly_income"]])
+        return np.clip(0.35 * flags.sum(axis=1), 0.0, 1.0), {"flags": flags}
+
+    def explain(self, detail, i):
+        return {"flags": [name for name, flagged in zip(FRAUD_FLAGS, detail["flags"][i]) if flagged]}
+
+
+def _predict_default(tenant_id, applicant):
+    """Corre dentro del worker: motor kNN del tenant ya precargado en el proceso"""
+    engine = scoring_engine.get_engine(tenant_id)
+    # la tasa de la banda de score del solicitante (agregados precalculados) sirve de prior
+    prior = float(risk_aggregates.get_aggregates(tenant_id).score_band_prior(applicant["credit_score"]))
+    result = engine.assess(applicant, prior=prior)
+    return result["risk_assessment"]["risk_score"], {
+        "similarity_score": result["similarity_score"],
+        "neighbors": result["neighbors"],
+        "engine": result["engine"],
+        # el worker puede ir un historial por detrás del proceso principal
+        "dataset_version": engine.dataset_version
+    }
+
+
+class DefaultPredictionAgent(Agent):
+    name = "Agent Iota"
+    specialization = "Predicción de Default"
+    mode = "process"
+    weight = 0.45
+    deadline_ms = 200.0
+    fallback_score = None   # sin kNN se usa la tasa base del tenant
+
+    def call(self, ctx):
+        return _predict_default, (ctx["engine"].tenant_id, ctx["applicant"])
+
+    def evaluate(self, engine, batch):
+        # en el masivo el kNN corre en el mismo hilo del bloque, con el prior por banda de score
+        risk, similarity = engine.score_batch(batch["age"], batch["monthly_income"], batch["credit_score"],
+                                              batch["city"], prior=batch["prior"])
+        return risk, {"similarity_score": similarity}
+
+
+AGENTS = [
+    IncomeAgent(),
+    CreditHistoryAgent(),
+    TransactionalAgent(),
+    DemographicAgent(),
+    FraudAgent(),
+    DefaultPredictionAgent(),
+]
+
+
+# --- POOL DE PROCESOS ---
+def _warm_worker(tenant_ids):
+    """Initializer de cada worker: carga los motores antes de la primera petición"""
+    for tenant_id in tenant_ids:
+        try:
+            scoring_engine.get_engine(tenant_id).build_index()
+            risk_aggregates.get_aggregates(tenant_id)
+        except Exception as e:
+            print(f"Error warming engine {tenant_id}: {e}")
+
+
+def _ping():
+    return os.getpid()
+
+
+class AgentStats:
+    __slots__ = ("calls", "ok", "fallbacks", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.ok = 0
+        self.fallbacks = 0
+        self.histogram = Histogram(LATENCY_BUCKETS)
+
+
+class ScoringOrchestrator:
+    """Lanza los agentes en paralelo, cada uno con su deadline, y combina sus scores"""
+
+    def __init__(self, agents=AGENTS, process_workers=PROCESS_POOL_WORKERS):
+        self.agents = list(agents)
+        self.process_workers = process_workers
+        self.pool = None
+        self.started = time.monotonic()
+        self.stats = {agent.name: AgentStats() for agent in self.agents}
+
+    def start(self, tenant_ids=()):
+        """Crea el pool; devuelve futuros que se resuelven cuando cada worker terminó de calentar"""
+        if self.pool is None and self.process_workers > 0:
+            # spawn: los workers no heredan el event loop ni los hilos del proceso padre
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+                initargs=(list(tenant_ids),)
+            )
+            return [self.pool.submit(_ping) for _ in range(self.process_workers)]
+        return []
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+    async def _execute(self, agent, ctx):
+        if agent.mode == "async":
+            return await agent.score(ctx)
+        fn, args = agent.call(ctx)
+        if agent.mode == "process" and self.pool is not None:
+            try:
+                return await asyncio.get_event_loop().run_in_executor(self.pool, fn, *args)
+            except BrokenProcessPool:
+                # un worker murió: se descarta el pool y este agente sigue en el threadpool
+                print(f"Process pool broken, {agent.name} falls back to threads")
+                self.pool = None
+        return await run_in_threadpool(fn, *args)
+
+    async def _run_agent(self, agent, ctx):
+        started = time.perf_counter()
+        status, detail = "ok", None
+        try:
+            outcome = await asyncio.wait_for(self._execute(agent, ctx), agent.deadline_ms / 1000)
+            if outcome is None:
+                status = "no_data"
+            else:
+                risk, detail = outcome
+        except asyncio.TimeoutError:
+            status = "timeout"
+        except Exception as e:
+            status = "error"
+            detail = {"error": str(e)}
+
+        if status != "ok":
+            risk = agent.fallback(ctx["engine"])
+
+        latency = time.perf_counter() - started
+        stats = self.stats[agent.name]
+        stats.calls += 1
+        stats.histogram.observe(latency)
+        if status in ("ok", "no_data"):
+            stats.ok += 1
+        if status != "ok":
+            stats.fallbacks += 1
+
+        return float(risk), {
+            **agent.describe(),
+            "status": status,
+            "risk_score": round(float(risk), 4),
+            "latency_ms": round(latency * 1000, 3),
+            "detail": detail
+        }
+
+    async def assess(self, engine, request):
+        """Evalúa una solicitud con todos los agentes; el motor define tenant y umbrales"""
+        started = time.perf_counter()
+        ctx = {"engine": engine, "applicant": request["applicant"], "batch": request_batch(request)}
+        outcomes = await asyncio.gather(*(self._run_agent(agent, ctx) for agent in self.agents))
+        risks, results = zip(*outcomes)
+
+        risk_score = combine([agent.weight for agent in self.agents], risks)
+        risk_level, decision = scoring_engine.classify_risk(risk_score, engine.risk_configuration)
+
+        # el detalle del agente kNN conserva los campos que ya devolvía /assess-credit
+        knn = next((r["detail"] for r in results if r["status"] == "ok" and "neighbors" in r["detail"]), {})
+        return {
+            "risk_assessment": {
+                "decision": decision,
+                "risk_level": risk_level,
+                "risk_score": round(risk_score, 4),
+                "thresholds": engine.risk_configuration
+            },
+            "similarity_score": knn.get("similarity_score", 0.0),
+            "neighbors": knn.get("neighbors"),
+            "engine": knn.get("engine", {"index": engine.index_type, "history_rows": engine.rows}),
+            "agents": list(results),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    def assess_batch(self, engine, columns, prior=None):
+        """Misma combinación que `assess` sobre un bloque (sin deadlines: corre en el hilo del lote)
+
+        Devuelve (risk_score, similarity_score, niveles, decisiones) como `engine.assess_batch`
+        """
+        batch = as_batch(columns, prior)
+        risks, similarity = [], np.zeros(len(batch["city"]))
+        for agent in self.agents:
+            risk, detail = agent.evaluate(engine, batch)
+            risks.append(np.where(np.isnan(risk), agent.fallback(engine), risk))
+            similarity = detail.get("similarity_score", similarity)
+
+        risk_score = combine([agent.weight for agent in self.agents], risks)
+        classified = [scoring_engine.classify_risk(r, engine.risk_configuration) for r in risk_score.tolist()]
+        levels, decisions = zip(*classified) if classified else ((), ())
+        return risk_score, similarity, levels, decisions
+
+    def summary(self):
+        """Throughput, tasa de respuestas a tiempo y p95 por agente, para el dashboard"""
+        uptime = max(time.monotonic() - self.started, 1e-9)
+        agents = []
+        for agent in self.agents:
+            stats = self.stats[agent.name]
+            agents.append({
+                **agent.describe(),
+                "status": "active" if stats.calls else "standby",
+                "calls": stats.calls,
+                "fallbacks": stats.fallbacks,
+                "throughput_per_min": round(60 * stats.calls / uptime, 1),
+                "on_time_rate": round(100 * stats.ok / stats.calls, 1) if stats.calls else None,
+                "p95_ms": round(1000 * stats.histogram.quantile(0.95), 3)
+            })
+        return agents
+
+orchestrator = ScoringOrchestrator()
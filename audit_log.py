@@ -0,0 +1,263 @@
+"""
+Bitácora de auditoría de evaluaciones en formato JSON lines.
+
+Los handlers entregan registros a una cola acotada en memoria sin bloquear
+el event loop; una tarea en segundo plano los serializa y escribe por lotes
+(un write + fsync por intervalo) en un hilo del threadpool. El archivo rota
+por tamaño o antigüedad y los rotados se comprimen con gzip en un hilo
+aparte, sin frenar las escrituras. Varios procesos pueden compartir el
+archivo: escritura y rotación van bajo un flock, y quien encuentra el archivo
+rotado por otro proceso lo reabre. Si el disco va lento, `log()` descarta y
+cuenta el descarte, y `put()` aplica backpressure.
+"""
+
+import asyncio
+import glob
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from fastapi.concurrency import run_in_threadpool
+
+from file_lock import exclusive_lock
+
+# --- CONFIGURACIÓN ---
+AUDIT_LOG_PATH = "../logs/requests.jsonl"
+MAX_QUEUE_RECORDS = 50_000
+FLUSH_INTERVAL = 1.0
+MAX_BATCH_RECORDS = 10_000
+MAX_FILE_BYTES = 64 * 1024 * 1024
+MAX_FILE_AGE = 24 * 3600
+PUT_TIMEOUT = 5.0
+COMPRESS_LEVEL = 1               # gzip rápido: los rotados se comprimen en segundo plano
+
+
+class AuditLogger:
+    """Cola acotada + escritor por lotes con rotación y compresión"""
+
+    def __init__(self, path=AUDIT_LOG_PATH, max_queue=MAX_QUEUE_RECORDS, flush_interval=FLUSH_INTERVAL,
+                 max_bytes=MAX_FILE_BYTES, max_age=MAX_FILE_AGE):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._pending = []            # dicts o bloques ya serializados (bytes, n_registros)
+        self._pending_records = 0
+        self._wakeup = None
+        self._space = None
+        self._task = None
+        self._file = None
+        self._opened_at = None
+
+        self.stats_counters = {
+            "enqueued": 0, "written": 0, "dropped": 0, "batches": 0,
+            "rotations": 0, "write_errors": 0, "last_flush_ms": 0.0,
+            "reopens": 0, "compressed": 0, "compress_errors": 0
+        }
+
+    # --- PRODUCTORES ---
+    def log(self, record):
+        """Encola sin esperar nunca; si la cola está llena el registro se descarta y se cuenta"""
+        return self._enqueue(record, 1)
+
+    def log_block(self, payload, records):
+        """Encola un bloque NDJSON ya serializado (p.ej. desde el threadpool del batch)"""
+        return self._enqueue((payload, records), records)
+
+    async def put(self, record, timeout=PUT_TIMEOUT):
+        """Variante con backpressure: espera espacio hasta `timeout` antes de descartar"""
+        return await self._put(record, 1, timeout)
+
+    async def put_block(self, payload, records, timeout=PUT_TIMEOUT):
+        return await self._put((payload, records), records, timeout)
+
+    def _enqueue(self, item, records):
+        if self._pending_records + records > self.max_queue:
+            self.stats_counters["dropped"] += records
+            return False
+        self._pending.append(item)
+        self._pending_records += records
+        self.stats_counters["enqueued"] += records
+        if self._wakeup is not None and self._pending_records >= MAX_BATCH_RECORDS:
+            self._wakeup.set()
+        return True
+
+    async def _put(self, item, records, timeout):
+        deadline = time.monotonic() + timeout
+        while self._pending_records + records > self.max_queue and self._space is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._wakeup.set()
+            self._space.clear()
+            try:
+                await asyncio.wait_for(self._space.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return self._enqueue(item, records)
+
+    # --- ESCRITOR ---
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, records = self._pending, self._pending_records
+        self._pending, self._pending_records = [], 0
+        if self._space is not None:
+            self._space.set()
+
+        started = time.perf_counter()
+        try:
+            await run_in_threadpool(self._write_batch, batch)
+            self.stats_counters["written"] += records
+            self.stats_counters["batches"] += 1
+        except OSError as e:
+            print(f"Error writing audit log: {e}")
+            self.stats_counters["write_errors"] += 1
+            self.stats_counters["dropped"] += records
+        self.stats_counters["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    def _write_batch(self, batch):
+        """Corre en el threadpool: serializa, un write, un fsync y rota si corresponde"""
+        parts = []
+        for item in batch:
+            if isinstance(item, tuple):
+                parts.append(item[0])
+            else:
+                parts.append((json.dumps(item, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+        data = b"".join(parts)
+
+        rotated = None
+        with exclusive_lock(self.lock_path):
+            if self._file is not None and self._rotated_elsewhere():
+                # otro proceso rotó el archivo: seguir en el descriptor viejo escribiría en el rotado
+                self._file.close()
+                self._file = None
+                self.stats_counters["reopens"] += 1
+            if self._file is None:
+                self._open()
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            if self._file.tell() >= self.max_bytes or time.time() - self._opened_at >= self.max_age:
+                rotated = self._rotate()
+        if rotated is not None:
+            self._compress_later(rotated)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._opened_at = time.time()
+
+    def _rotated_elsewhere(self):
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _rotate(self):
+        """Solo renombra (bajo el lock); la compresión corre después, fuera del escritor"""
+        self._file.close()
+        self._file = None
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        os.replace(self.path, rotated)
+        self.stats_counters["rotations"] += 1
+        return rotated
+
+    def _compress_later(self, *paths):
+        if paths:
+            threading.Thread(target=self._compress, args=paths, name="audit-compress", daemon=True).start()
+
+    def _compress(self, *paths):
+        for path in paths:
+            try:
+                compress_rotated(path)
+                self.stats_counters["compressed"] += 1
+            except OSError as e:
+                print(f"Error compressing audit log {path}: {e}")
+                self.stats_counters["compress_errors"] += 1
+
+    # --- CICLO DE VIDA ---
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Event()
+            self._task = asyncio.get_event_loop().create_task(self._run())
+            # rotados que quedaron sin comprimir (p.ej. un reinicio a mitad de la compresión)
+            self._compress_later(*(name for name in rotated_files(self.path)
+                                   if name != self.path and not name.endswith(".gz")))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._file is not None:
+            await run_in_threadpool(self._file.close)
+            self._file = None
+
+    def stats(self):
+        return {**self.stats_counters, "queue_depth": self._pending_records, "path": self.path}
+
+
+# --- COMPRESIÓN ---
+def compress_rotated(path, level=COMPRESS_LEVEL):
+    """Comprime un archivo rotado a .gz vía temporal y borra el original"""
+    tmp = f"{path}.gz.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(path, "rb") as src, gzip.open(tmp, "wb", compresslevel=level) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp, path + ".gz")
+    os.remove(path)
+
+
+# --- LECTURA ---
+def rotated_files(path=AUDIT_LOG_PATH):
+    """Archivos de la bitácora en orden cronológico: rotados (.gz o no) y luego el actual"""
+    base, ext = os.path.splitext(path)
+    plain = glob.glob(f"{glob.escape(base)}-*{ext}")
+    # mientras se comprime existen ambos: se lee el original, que siempre está completo
+    rotated = plain + [name for name in glob.glob(f"{glob.escape(base)}-*{ext}.gz") if name[:-3] not in plain]
+    files = sorted(rotated, key=lambda name: name[:-3] if name.endswith(".gz") else name)
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def iter_audit_records(path=AUDIT_LOG_PATH):
+    """Itera registros de todo el conjunto rotado línea a línea, sin cargar archivos completos"""
+    for filename in rotated_files(path):
+        opener = gzip.open if filename.endswith(".gz") else open
+        with opener(filename, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # una línea truncada por un corte a mitad de escritura no detiene el replay
+                    continue
+
+
+audit = AuditLogger()
@@ -0,0 +1,247 @@
+"""
+Evaluación masiva para POST /assess-credit/batch.
+
+La entrada (NDJSON o CSV) se lee del cuerpo de la petición como stream, se
+agrupa en bloques de tamaño fijo y cada bloque se evalúa con operaciones
+vectorizadas (los mismos agentes y pesos que /assess-credit); las decisiones
+salen como NDJSON a medida que se producen, terminando con un registro
+trailer de estadísticas.
+"""
+
+import csv
+import json
+import math
+import time
+from datetime import datetime
+
+from fastapi.concurrency import run_in_threadpool
+
+# --- CONFIGURACIÓN ---
+DEFAULT_CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 20000
+APPLICANT_FIELDS = ("age", "monthly_income", "credit_score", "city")
+OPTIONAL_APPLICANT_FIELDS = ("debt_to_income_ratio", "late_payments")
+LOAN_FIELDS = ("loan_amount", "loan_term_months")
+BATCH_FIELDS = (*APPLICANT_FIELDS, *OPTIONAL_APPLICANT_FIELDS, *LOAN_FIELDS)
+INTEGER_FIELDS = ("age", "credit_score", "late_payments", "loan_term_months")   # conint en el modelo
+MINIMUMS = {"loan_term_months": 1}
+ID_FIELDS = ("id", "applicant_id", "request_id")
+
+
+# --- LECTURA DEL STREAM ---
+class UndecodableLine:
+    """Línea con bytes que no son UTF-8; se reporta como error en su posición del lote"""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def decode_line(line):
+    try:
+        return line.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        return UndecodableLine(f"Línea no es UTF-8 válido: {e}")
+
+
+async def iter_lines(stream):
+    """Convierte un stream de bytes en líneas de texto sin acumular el cuerpo completo"""
+    pending = b""
+    async for data in stream:
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line = line.rstrip(b"\r")
+            if line.strip():
+                yield decode_line(line)
+    if pending.strip():
+        yield decode_line(pending.rstrip(b"\r"))
+
+
+async def iter_chunks(lines, size):
+    """Agrupa líneas en bloques de como máximo `size` elementos"""
+    chunk = []
+    async for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- PARSEO DE REGISTROS ---
+def parse_ndjson(lines):
+    """Cada línea es un body de /assess-credit o un solicitante plano"""
+    for line in lines:
+        if isinstance(line, UndecodableLine):
+            yield None, line.error
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield None, f"JSON inválido: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield None, "Registro no es un objeto JSON"
+            continue
+        yield record, None
+
+
+def parse_csv(lines, header):
+    """Las columnas del CSV son los campos del solicitante (más id opcional)"""
+    for line in lines:
+        if isinstance(header, UndecodableLine):
+            yield None, f"Encabezado CSV inválido: {header.error}"
+            continue
+        if isinstance(line, UndecodableLine):
+            yield None, line.error
+            continue
+        row = next(csv.reader([line]), [])
+        if len(row) != len(header):
+            yield None, f"Se esperaban {len(header)} columnas, llegaron {len(row)}"
+            continue
+        yield dict(zip(header, row)), None
+
+
+def record_id(record, position):
+    for field in ID_FIELDS:
+        if record.get(field) is not None:
+            return record[field]
+    return position
+
+
+def extract_applicant(record):
+    """Normaliza un registro a las columnas del lote; los campos opcionales ausentes quedan en None"""
+    applicant = record.get("applicant", record)
+    missing = [field for field in APPLICANT_FIELDS if applicant.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"Campos faltantes: {', '.join(missing)}")
+    if not isinstance(applicant["city"], str):
+        raise ValueError("city debe ser texto")
+    values = {field: float(applicant[field]) for field in APPLICANT_FIELDS[:3]}
+    for field in OPTIONAL_APPLICANT_FIELDS:
+        values[field] = None if applicant.get(field) in (None, "") else float(applicant[field])
+    for field in LOAN_FIELDS:
+        values[field] = None if record.get(field) in (None, "") else float(record[field])
+    # float() acepta "nan", "inf", negativos y decimales: mismas reglas que el modelo de /assess-credit
+    invalid = [field for field, value in values.items()
+               if value is not None and not (math.isfinite(value) and value >= MINIMUMS.get(field, 0))]
+    if invalid:
+        raise ValueError(f"Valores inválidos (deben ser finitos y >= 0, plazo >= 1): {', '.join(invalid)}")
+    fractional = [field for field in INTEGER_FIELDS if values[field] is not None and not values[field].is_integer()]
+    if fractional:
+        raise ValueError(f"Valores inválidos (deben ser enteros): {', '.join(fractional)}")
+    values["city"] = applicant["city"]
+    return values
+
+
+def knn_scorer(engine, columns, prior=None):
+    """Scorer por defecto: solo el kNN del motor"""
+    return engine.assess_batch(columns["age"], columns["monthly_income"], columns["credit_score"],
+                               columns["city"], prior=prior)
+
+
+# --- SCORING POR BLOQUE ---
+def score_chunk(engine, lines, fmt, header, offset, audit=False, priors=None, scorer=knn_scorer):
+    """Parsea y evalúa un bloque; devuelve (payload NDJSON, evaluados, errores, payload de auditoría)
+
+    `priors` mapea un array de credit_score a la tasa previa de cada solicitante y
+    `scorer(engine, columnas, prior)` devuelve (risk_score, similarity_score, niveles, decisiones)
+    """
+    parsed = parse_csv(lines, header) if fmt == "csv" else parse_ndjson(lines)
+
+    out = [None] * len(lines)
+    valid_rows, ids, rows = [], [], []
+    for position, (record, error) in enumerate(parsed):
+        if record is not None:
+            try:
+                values = extract_applicant(record)
+            except (ValueError, TypeError, AttributeError) as e:
+                error = str(e)
+        if error is not None:
+            out[position] = {"id": record_id(record or {}, offset + position), "error": error}
+            continue
+        valid_rows.append(position)
+        ids.append(record_id(record, offset + position))
+        rows.append(values)
+
+    audit_lines = []
+    if valid_rows:
+        columns = {field: [row[field] for row in rows] for field in BATCH_FIELDS}
+        prior = priors(columns["credit_score"]) if priors is not None else None
+        risk_score, similarity_score, levels, decisions = scorer(engine, columns, prior)
+        ts = datetime.now().isoformat()
+        for i, position in enumerate(valid_rows):
+            out[position] = {
+                "id": ids[i],
+                "decision": decisions[i],
+                "risk_level": levels[i],
+                "risk_score": round(float(risk_score[i]), 4),
+                "similarity_score": round(float(similarity_score[i]), 2)
+            }
+            if audit:
+                row = rows[i]
+                applicant = {field: row[field] for field in (*APPLICANT_FIELDS, *OPTIONAL_APPLICANT_FIELDS)
+                             if row[field] is not None}
+                loan = {field: row[field] for field in LOAN_FIELDS if row[field] is not None}
+                audit_lines.append(json.dumps({
+                    "ts": ts,
+                    "type": "batch_assessment",
+                    "tenant_id": engine.tenant_id,
+                    "request": {"applicant": applicant, **loan},
+                    **out[position]
+                }, ensure_ascii=False) + "\n")
+
+    payload = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in out)
+    audit_payload = "".join(audit_lines).encode("utf-8") if audit_lines else None
+    return payload.encode("utf-8"), len(valid_rows), len(lines) - len(valid_rows), audit_payload
+
+
+async def stream_assessments(engine, stream, fmt="ndjson", chunk_size=DEFAULT_CHUNK_SIZE, audit=None, priors=None,
+                             scorer=knn_scorer):
+    """Generador NDJSON: una línea por solicitante y un trailer con estadísticas del lote"""
+    started = time.perf_counter()
+    stats = {"records": 0, "scored": 0, "errors": 0, "chunks": 0}
+    chunk_ms = []
+
+    lines = iter_lines(stream)
+    header = None
+    if fmt == "csv":
+        async for first in lines:
+            # con un encabezado ilegible cada fila sale como error, pero el stream llega al trailer
+            header = first if isinstance(first, UndecodableLine) else [column.strip() for column in next(csv.reader([first]))]
+            break
+
+    async for chunk in iter_chunks(lines, chunk_size):
+        chunk_started = time.perf_counter()
+        payload, scored, errors, audit_payload = await run_in_threadpool(
+            score_chunk, engine, chunk, fmt, header, stats["records"], audit is not None, priors, scorer
+        )
+        if audit_payload:
+            # backpressure: si el disco de auditoría va lento, el lote se frena en vez de perder registros
+            await audit.put_block(audit_payload, scored)
+        chunk_ms.append((time.perf_counter() - chunk_started) * 1000)
+        stats["records"] += len(chunk)
+        stats["scored"] += scored
+        stats["errors"] += errors
+        stats["chunks"] += 1
+        yield payload
+
+    elapsed = time.perf_counter() - started
+    chunk_ms.sort()
+    trailer = {
+        "type": "trailer",
+        "tenant_id": engine.tenant_id,
+        **stats,
+        "chunk_size": chunk_size,
+        "elapsed_s": round(elapsed, 4),
+        "records_per_s": round(stats["records"] / elapsed, 1) if elapsed > 0 else 0.0,
+        "chunk_ms": {
+            "p50": round(chunk_ms[len(chunk_ms) // 2], 3) if chunk_ms else 0.0,
+            "max": round(chunk_ms[-1], 3) if chunk_ms else 0.0
+        },
+        "index": engine.index_type
+    }
+    yield (json.dumps(trailer, ensure_ascii=False) + "\n").encode("utf-8")
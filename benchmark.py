@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Benchmark reproducible de la API a partir de los escenarios de test_api.py
+
+Ejemplos:
+    python benchmark.py --app simple_api:app --concurrency 32 --duration 20 --out bench.json
+    python benchmark.py --url http://localhost:8000 --rate 500 --duration 30
+    python benchmark.py --app simple_api:app --compare bench_base.json --threshold 0.10
+    python benchmark.py --app simple_api:app --replay ../logs/requests.jsonl --speed 2
+    python benchmark.py --url http://localhost:8000 --setup --repeat-payloads
+
+Las evaluaciones varían el monto del préstamo en cada petición para no medir
+solo aciertos de la caché de decisiones (--repeat-payloads la mide a propósito).
+Las latencias y percentiles son solo de respuestas 2xx; los errores se reportan
+aparte por código.
+
+Requiere httpx (pip install httpx), que no es dependencia de producción.
+"""
+
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from audit_log import iter_audit_records
+from sample_requests import ALTO_RIESGO, BAJO_RIESGO, TENANT_ID
+
+# Escenarios por defecto: los mismos endpoints que recorre test_api.py
+TENANT_HEADERS = {"X-Tenant-ID": TENANT_ID}
+SCENARIOS = [
+    {"name": "GET /", "method": "GET", "path": "/"},
+    {"name": "GET /health", "method": "GET", "path": "/health"},
+    {"name": "GET /institutions", "method": "GET", "path": "/institutions"},
+    {"name": "GET /data-test", "method": "GET", "path": "/data-test"},
+    {"name": "POST /assess-credit bajo_riesgo", "method": "POST", "path": "/assess-credit",
+     "json": BAJO_RIESGO, "headers": TENANT_HEADERS, "vary": True},
+    {"name": "POST /assess-credit alto_riesgo", "method": "POST", "path": "/assess-credit",
+     "json": ALTO_RIESGO, "headers": TENANT_HEADERS, "vary": True},
+]
+
+# Límites de admisión del tenant con --setup: holgados para medir el scoring, no el limitador
+BENCHMARK_ADMISSION = {
+    "rate_per_second": 100000,
+    "burst": 100000,
+    "max_concurrency": 64,
+    "max_queue": 1000,
+    "weight": 1.0
+}
+
+# Métricas comparadas contra la línea base: (clave, True si más alto es peor)
+REGRESSION_METRICS = [("p50_ms", True), ("p95_ms", True), ("p99_ms", True), ("throughput_rps", False)]
+
+
+def percentile(sorted_values, q):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def wait_ready(client, timeout=60.0):
+    """Espera a que /health/ready responda 200 (404: servidor sin readiness, se sigue)"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        response = await client.get("/health/ready")
+        if response.status_code in (200, 404):
+            return
+        await asyncio.sleep(0.1)
+    print("⚠️ El servidor no quedó listo a tiempo; se mide igual")
+
+
+class Recorder:
+    """Acumula latencias de respuestas 2xx y cuenta errores por escenario"""
+
+    def __init__(self):
+        self.requests = {}
+        self.samples = {}
+        self.errors = {}
+        self.status = {}
+
+    def record(self, name, latency_ms, status):
+        self.requests[name] = self.requests.get(name, 0) + 1
+        codes = self.status.setdefault(name, {})
+        codes[str(status)] = codes.get(str(status), 0) + 1
+        if isinstance(status, int) and 200 <= status < 300:
+            self.samples.setdefault(name, []).append(latency_ms)
+        else:
+            # un 429/503 rápido o un timeout no deben mover los percentiles
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for name, requests in self.requests.items():
+            latencies = sorted(self.samples.get(name, []))
+            errors = self.errors.get(name, 0)
+            endpoints[name] = {
+                "requests": requests,
+                "ok": len(latencies),
+                "errors": errors,
+                "error_rate": round(errors / requests, 4),
+                "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+                "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                "p50_ms": round(percentile(latencies, 50), 3) if latencies else None,
+                "p95_ms": round(percentile(latencies, 95), 3) if latencies else None,
+                "p99_ms": round(percentile(latencies, 99), 3) if latencies else None,
+                "max_ms": round(latencies[-1], 3) if latencies else None,
+                "status": self.status.get(name, {})
+            }
+        return endpoints
+
+
+# --- CLIENTE ---
+def load_app(spec):
+    """Importa una app ASGI con la forma modulo:atributo"""
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr or "app")
+
+
+def make_client(args, app):
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("❌ benchmark.py requiere httpx: pip install httpx")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if app is not None:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark",
+                                 timeout=args.timeout, limits=limits)
+    return httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits)
+
+
+_sequence = itertools.count(1)
+
+
+def vary_payload(payload):
+    """Copia de la evaluación con un monto distinto por petición: otra clave en la caché de decisiones"""
+    return {**payload, "loan_amount": payload["loan_amount"] + next(_sequence)}
+
+
+async def send(client, recorder, scenario, repeat_payloads=False):
+    payload = scenario.get("json")
+    if scenario.get("vary") and not repeat_payloads:
+        payload = vary_payload(payload)
+    started = time.perf_counter()
+    try:
+        response = await client.request(
+            scenario["method"], scenario["path"],
+            json=payload, headers=scenario.get("headers")
+        )
+        await response.aread()
+        status = response.status_code
+    except Exception as e:
+        status = type(e).__name__
+    recorder.record(scenario["name"], (time.perf_counter() - started) * 1000, status)
+
+
+# --- MODOS DE CARGA ---
+async def closed_loop(client, recorder, scenarios, args):
+    """N workers concurrentes, cada uno lanza la siguiente petición al terminar la anterior"""
+    deadline = time.perf_counter() + args.duration
+    budget = {"remaining": args.requests}
+
+    async def worker(offset):
+        i = offset
+        while time.perf_counter() < deadline:
+            if args.requests:
+                if budget["remaining"] <= 0:
+                    return
+                budget["remaining"] -= 1
+            await send(client, recorder, scenarios[i % len(scenarios)], args.repeat_payloads)
+            i += 1
+
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+
+
+async def open_loop(client, recorder, scenarios, args, rng):
+    """Llegadas de Poisson a `rate` req/s, independientes de la latencia de la respuesta"""
+    deadline = time.perf_counter() + args.duration
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+    tasks = set()
+    next_at = time.perf_counter()
+    i = 0
+
+    async def fire(scenario):
+        async with in_flight:
+            await send(client, recorder, scenario, args.repeat_payloads)
+
+    while next_at < deadline and (not args.requests or i < args.requests):
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.ensure_future(fire(scenarios[i % len(scenarios)]))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        i += 1
+        next_at += rng.expovariate(args.rate)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def replay(client, recorder, records, args):
+    """Reproduce tráfico grabado respetando los tiempos relativos (escalados por --speed)"""
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+    started = time.perf_counter()
+    tasks = []
+
+    async def fire(scenario):
+        async with in_flight:
+            await send(client, recorder, scenario, args.repeat_payloads)
+
+    for offset, scenario in records:
+        if offset is not None and args.speed > 0:
+            delay = offset / args.speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(fire(scenario)))
+
+    await asyncio.gather(*tasks)
+
+
+def load_replay(path):
+    """Lee tráfico grabado: líneas {method, path, headers, json} o registros de la bitácora de
+    auditoría (incluidos sus archivos rotados y comprimidos)"""
+    records, first_ts = [], None
+    for record in iter_audit_records(path):
+        if "path" in record:
+            scenario = {
+                "method": record.get("method", "GET").upper(),
+                "path": record["path"],
+                "headers": record.get("headers"),
+                "json": record.get("json", record.get("body"))
+            }
+        elif record.get("type") == "batch_assessment":
+            # los lotes se reproducen reenviando su archivo de entrada, no registro a registro
+            continue
+        elif "request" in record and "applicant" in record["request"]:
+            scenario = {
+                "method": "POST", "path": "/assess-credit",
+                "headers": {"X-Tenant-ID": record.get("tenant_id", TENANT_ID)},
+                "json": record["request"]
+            }
+        else:
+            continue
+        scenario["name"] = record.get("name") or f"{scenario['method']} {scenario['path']}"
+
+        offset = None
+        ts = record.get("ts") or record.get("timestamp")
+        if ts is not None:
+            ts = ts if isinstance(ts, (int, float)) else datetime.fromisoformat(ts).timestamp()
+            first_ts = ts if first_ts is None else first_ts
+            offset = ts - first_ts
+        records.append((offset, scenario))
+    return records
+
+
+# --- PREPARACIÓN ---
+async def configure_admission(client, timeout=10.0):
+    """Escribe BENCHMARK_ADMISSION en el JSON del tenant y espera a que el registro lo recargue.
+
+    Requiere que el servidor lea su configuración del mismo disco (--app o un uvicorn local
+    lanzado desde el mismo directorio)."""
+    listing = (await client.get("/institutions")).json()
+    path = os.path.join(listing["config_dir"], f"{TENANT_ID}.json")
+    try:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            config = json.load(f)
+        config["admission_control"] = {**config.get("admission_control", {}), **BENCHMARK_ADMISSION}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2, ensure_ascii=False)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ No se pudieron ajustar los límites de admisión ({path}): {e}")
+        return
+
+    # /institutions barre el directorio como máximo cada REFRESH_INTERVAL segundos
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if (await client.get("/institutions")).json()["registry_version"] > listing["registry_version"]:
+            return
+        await asyncio.sleep(0.2)
+    print("⚠️ El servidor no recargó los límites de admisión a tiempo; se mide igual")
+
+
+# --- REPORTE Y COMPARACIÓN ---
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Devuelve la lista de regresiones mayores que `threshold` (fracción) por endpoint"""
+    regressions = []
+    # el throughput solo es comparable entre corridas con el mismo modo de carga
+    metrics = [m for m in REGRESSION_METRICS
+               if m[0] != "throughput_rps" or baseline.get("mode") == results["mode"]]
+    for name, current in results["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base:
+            continue
+        for key, higher_is_worse in metrics:
+            before, after = base.get(key), current.get(key)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (change if higher_is_worse else -change) > threshold:
+                regressions.append({"endpoint": name, "metric": key, "baseline": before,
+                                    "current": after, "change": round(change, 4)})
+        if current["error_rate"] > base.get("error_rate", 0) + threshold:
+            regressions.append({"endpoint": name, "metric": "error_rate", "baseline": base.get("error_rate", 0),
+                                "current": current["error_rate"], "change": None})
+    return regressions
+
+
+def print_report(results):
+    print(f"\n{'='*100}")
+    print(f"  BENCHMARK - {results['mode']} - {results['target']}")
+    print(f"{'='*100}")
+    print(f"{'Endpoint':<40}{'req':>8}{'err%':>8}{'rps 2xx':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in results["endpoints"].items():
+        latencies = "".join(f"{stats[key]:>10.2f}" if stats[key] is not None else f"{'-':>10}"
+                            for key in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"{name[:39]:<40}{stats['requests']:>8}{stats['error_rate'] * 100:>7.1f}%"
+              f"{stats['throughput_rps']:>10.1f}{latencies}")
+    for name, stats in results["endpoints"].items():
+        if stats["errors"]:
+            codes = {code: count for code, count in stats["status"].items() if not code.startswith("2")}
+            print(f"   ⚠️ {name}: {stats['errors']} errores {codes}")
+    print(f"\n   Total: {results['total_requests']} requests ({results['total_errors']} errores) "
+          f"en {results['elapsed_s']:.2f}s ({results['throughput_rps']:.1f} req/s 2xx)")
+
+
+async def run(args):
+    app = load_app(args.app) if args.app else None
+    rng = random.Random(args.seed)
+
+    scenarios = SCENARIOS
+    if args.endpoints:
+        wanted = [e.strip() for e in args.endpoints.split(",")]
+        scenarios = [s for s in SCENARIOS if s["path"] in wanted or s["name"] in wanted]
+
+    if app is not None:
+        await app.router.startup()
+    try:
+        async with make_client(args, app) as client:
+            if args.setup:
+                await client.get("/setup-all")
+                await configure_admission(client)
+            # no se mide durante el calentamiento del servidor (historiales, índices, pool de agentes)
+            await wait_ready(client)
+
+            if args.warmup:
+                await closed_loop(client, Recorder(), scenarios,
+                                  argparse.Namespace(**{**vars(args), "requests": args.warmup, "duration": 60}))
+
+            recorder = Recorder()
+            started = time.perf_counter()
+            if args.replay:
+                mode = "replay"
+                await replay(client, recorder, load_replay(args.replay), args)
+            elif args.rate:
+                mode = f"open-loop {args.rate} req/s"
+                await open_loop(client, recorder, scenarios, args, rng)
+            else:
+                mode = f"closed-loop concurrency={args.concurrency}"
+                await closed_loop(client, recorder, scenarios, args)
+            elapsed = time.perf_counter() - started
+    finally:
+        if app is not None:
+            await app.router.shutdown()
+
+    endpoints = recorder.summary(elapsed)
+    total = sum(e["requests"] for e in endpoints.values())
+    ok = sum(e["ok"] for e in endpoints.values())
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "target": args.app or args.url,
+        "mode": mode,
+        "config": {key: getattr(args, key) for key in
+                   ("concurrency", "rate", "duration", "requests", "warmup", "seed", "replay", "speed",
+                    "setup", "repeat_payloads")},
+        "elapsed_s": round(elapsed, 4),
+        "total_requests": total,
+        "total_errors": total - ok,
+        "throughput_rps": round(ok / elapsed, 2) if elapsed > 0 else 0.0,
+        "endpoints": endpoints
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de CredICEfi Multi-Tenant API")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--app", help="App ASGI en proceso, p.ej. simple_api:app")
+    target.add_argument("--url", default="http://localhost:8000", help="URL de un uvicorn local")
+    parser.add_argument("--concurrency", type=int, default=16, help="workers en lazo cerrado")
+    parser.add_argument("--rate", type=float, default=0.0, help="llegadas/s en lazo abierto (0 = lazo cerrado)")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="tope de peticiones en vuelo (lazo abierto)")
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos de medición")
+    parser.add_argument("--requests", type=int, default=0, help="tope de peticiones (0 = sin tope)")
+    parser.add_argument("--warmup", type=int, default=50, help="peticiones de calentamiento no medidas")
+    parser.add_argument("--endpoints", help="lista separada por comas de paths o nombres de escenario")
+    parser.add_argument("--setup", action="store_true",
+                        help="llama /setup-all y ajusta los límites de admisión del tenant antes de medir")
+    parser.add_argument("--repeat-payloads", action="store_true",
+                        help="repite las evaluaciones idénticas (mide los aciertos de la caché de decisiones)")
+    parser.add_argument("--replay", help="archivo .jsonl de tráfico grabado a reproducir")
+    parser.add_argument("--speed", type=float, default=1.0, help="factor de velocidad del replay (0 = sin esperas)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="escribe los resultados en JSON")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regresión tolerada (fracción)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    print_report(results)
+
+    status = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        results["regressions"] = regressions
+        if regressions:
+            print(f"\n❌ {len(regressions)} regresiones sobre {args.threshold:.0%}:")
+            for r in regressions:
+                print(f"   {r['endpoint']} {r['metric']}: {r['baseline']} -> {r['current']}")
+            status = 1
+        else:
+            print(f"\n✅ Sin regresiones sobre {args.threshold:.0%}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"   📄 Resultados: {args.out}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,419 @@
+"""
+Almacén columnar por tenant para historical_defaults.csv.
+
+El CSV de cada tenant se convierte una sola vez a columnas binarias tipadas
+(ciudad codificada con diccionario) bajo ../data/<tenant>/store/. Las columnas
+se abren con np.memmap, así varios workers de uvicorn comparten las mismas
+páginas del sistema operativo en lugar de tener cada uno su DataFrame.
+
+meta.json es el punto de commit: las ingestas añaden bytes al final de cada
+columna y después reemplazan meta.json de forma atómica con el nuevo conteo
+de filas, por lo que los lectores nunca ven filas a medio escribir. Las
+escrituras (conversión e ingesta) se serializan entre procesos con un flock
+sobre ../data/<tenant>/.store.lock.
+
+Las filas ingeridas por POST /tenant/history no están en el CSV: además de
+las columnas se guardan en ../data/<tenant>/ingested_history.ndjson, que se
+vuelve a aplicar después de cada reconversión del CSV para no perderlas.
+"""
+
+import csv
+import itertools
+import json
+import operator
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from file_lock import exclusive_lock
+
+# --- CONFIGURACIÓN ---
+DATA_DIR = "../data"
+HISTORY_FILENAME = "historical_defaults.csv"
+STORE_DIRNAME = "store"
+META_FILENAME = "meta.json"
+LOCK_FILENAME = ".store.lock"
+INGEST_LOG_FILENAME = "ingested_history.ndjson"
+STORE_FORMAT = "credicefi-columnar-v1"
+CSV_CHUNK_ROWS = 500_000
+SAMPLE_ROWS = 3
+REFRESH_INTERVAL = 1.0
+
+SCHEMA = {
+    "edad": "<i2",
+    "ingresos": "<f8",
+    "ciudad": "<i4",  # código en el diccionario `cities`
+    "score_crediticio": "<i2",
+    "moroso": "|i1",
+}
+# rangos válidos (los mismos de HistoryRecord); las filas fuera de rango no entran al almacén
+VALID_RANGES = {
+    "edad": (0, 150),
+    "ingresos": (0, np.inf),
+    "score_crediticio": (0, 1000),
+    "moroso": (0, 1),
+}
+INTEGER_COLUMNS = ("edad", "score_crediticio", "moroso")
+
+
+class DatasetNotFound(LookupError):
+    """El tenant no tiene historial ni almacén columnar"""
+
+
+def to_float(values):
+    """Texto o números a float64; celdas vacías o no numéricas quedan en NaN"""
+    try:
+        return np.fromiter(map(float, values), dtype=np.float64, count=len(values))
+    except (TypeError, ValueError):
+        return np.array([_float_or_nan(value) for value in values], dtype=np.float64)
+
+
+def _float_or_nan(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class TenantDataset:
+    """Vista memory-mapped del almacén columnar de un tenant"""
+
+    def __init__(self, key, data_dir=DATA_DIR):
+        self.key = key
+        self.tenant_dir = os.path.join(data_dir, key)
+        self.csv_path = os.path.join(self.tenant_dir, HISTORY_FILENAME)
+        self.store_dir = os.path.join(self.tenant_dir, STORE_DIRNAME)
+        self.lock_path = os.path.join(self.tenant_dir, LOCK_FILENAME)
+        self.ingest_log_path = os.path.join(self.tenant_dir, INGEST_LOG_FILENAME)
+        self.meta = None
+        self._meta_mtime_ns = None
+        self._columns = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    # --- METADATA ---
+    @property
+    def meta_path(self):
+        return os.path.join(self.store_dir, META_FILENAME)
+
+    @property
+    def rows(self):
+        return self.meta["rows"]
+
+    @property
+    def version(self):
+        return self.meta["version"]
+
+    @property
+    def cities(self):
+        return self.meta["cities"]
+
+    @property
+    def build_id(self):
+        """Cambia solo al reconstruir desde el CSV; las ingestas lo conservan"""
+        return self.meta.get("build_id")
+
+    def _read_meta(self):
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, meta, store_dir=None):
+        path = os.path.join(store_dir or self.store_dir, META_FILENAME)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _source_stat(self):
+        stat = os.stat(self.csv_path)
+        return {"path": self.csv_path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    def _is_stale(self, meta):
+        """El almacén se reconstruye si el CSV de origen cambió desde la conversión"""
+        if meta.get("format") != STORE_FORMAT:
+            return True
+        if not os.path.exists(self.csv_path):
+            return False
+        source = meta.get("source") or {}
+        current = self._source_stat()
+        return (source.get("mtime_ns"), source.get("size")) != (current["mtime_ns"], current["size"])
+
+    # --- APERTURA ---
+    def open(self):
+        """Abre el almacén, convirtiendo el CSV la primera vez o si cambió"""
+        with self._lock:
+            meta = self._read_meta() if os.path.exists(self.meta_path) else None
+            if meta is None or self._is_stale(meta):
+                if not os.path.exists(self.csv_path):
+                    raise DatasetNotFound(f"Historial no encontrado para '{self.key}': {self.csv_path}")
+                with exclusive_lock(self.lock_path):
+                    # otro worker pudo convertir (o ingerir) mientras se esperaba el lock
+                    meta = self._read_meta() if os.path.exists(self.meta_path) else None
+                    if meta is None or self._is_stale(meta):
+                        self._convert_csv(meta or {})
+                        meta = self._read_meta()
+            self._set_meta(meta)
+        return self
+
+    def refresh(self, force=False):
+        """Relee meta.json si otro proceso ingirió filas; barato (un stat por intervalo)"""
+        now = time.monotonic()
+        if not force and now - self._last_check < REFRESH_INTERVAL:
+            return False
+        self._last_check = now
+        try:
+            mtime_ns = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if mtime_ns == self._meta_mtime_ns and not self._is_stale(self.meta):
+            return False
+        self.open()
+        return True
+
+    def _set_meta(self, meta):
+        self.meta = meta
+        self._meta_mtime_ns = os.stat(self.meta_path).st_mtime_ns
+        self._columns = {}
+        self._last_check = time.monotonic()
+
+    # --- COLUMNAS ---
+    def column(self, name):
+        """Columna memory-mapped de solo lectura, acotada al conteo de filas confirmado"""
+        array = self._columns.get(name)
+        if array is None:
+            dtype = np.dtype(SCHEMA[name])
+            if self.rows == 0:
+                array = np.empty(0, dtype=dtype)
+            else:
+                path = os.path.join(self.store_dir, f"{name}.bin")
+                array = np.memmap(path, dtype=dtype, mode="r", shape=(self.rows,))
+            self._columns[name] = array
+        return array
+
+    def columns(self):
+        return {name: self.column(name) for name in SCHEMA}
+
+    def sample(self, n=SAMPLE_ROWS):
+        """Primeras filas decodificadas, tal como las devolvería df.head(n)"""
+        return self.meta.get("sample", [])[:n]
+
+    def describe(self):
+        return {
+            "rows": self.rows,
+            "columns": list(SCHEMA),
+            "schema": SCHEMA,
+            "cities": len(self.cities),
+            "version": self.version,
+            "rejected_rows": self.meta.get("rejected_rows", 0),
+            "updated": self.meta.get("updated"),
+            "sample": self.sample()
+        }
+
+    # --- ESCRITURA ---
+    def _encode(self, frame, cities, city_index):
+        """Convierte un bloque (dict de listas) a arrays tipados; devuelve (arrays, máscara de filas válidas)
+
+        Se descartan filas con valores vacíos, no finitos, fuera de rango, decimales
+        en columnas enteras o sin ciudad: un solo NaN dañaría las estadísticas del tenant
+        """
+        numeric = {name: to_float(frame[name]) for name in VALID_RANGES}
+        names = np.asarray(frame["ciudad"], dtype=str)
+        valid = np.char.strip(names) != ""
+        for name, (low, high) in VALID_RANGES.items():
+            values = numeric[name]
+            valid &= np.isfinite(values) & (values >= low) & (values <= high)
+            if name in INTEGER_COLUMNS:
+                valid &= np.floor(values) == values
+
+        uniques, inverse = np.unique(names[valid], return_inverse=True)
+        lookup = np.empty(len(uniques), dtype=SCHEMA["ciudad"])
+        for i, city in enumerate(uniques):
+            city = city.strip()
+            code = city_index.get(city)
+            if code is None:
+                code = city_index[city] = len(cities)
+                cities.append(city)
+            lookup[i] = code
+
+        encoded = {name: values[valid].astype(SCHEMA[name]) for name, values in numeric.items()}
+        encoded["ciudad"] = lookup[inverse.reshape(-1)]
+        return encoded, valid
+
+    def _decode_rows(self, encoded, cities, n):
+        rows = []
+        for i in range(min(n, len(encoded["moroso"]))):
+            row = {name: encoded[name][i].item() for name in SCHEMA}
+            row["ciudad"] = cities[row["ciudad"]]
+            rows.append(row)
+        return rows
+
+    def _csv_chunks(self):
+        """Bloques (dict de listas de texto) del CSV de origen; solo las columnas del esquema"""
+        with open(self.csv_path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.reader(f)
+            header = [column.strip() for column in next(reader, [])]
+            missing = [name for name in SCHEMA if name not in header]
+            if missing:
+                raise ValueError(f"Columnas faltantes en {self.csv_path}: {', '.join(missing)}")
+            pick = operator.itemgetter(*(header.index(name) for name in SCHEMA))
+            padding = [""] * len(header)
+            while True:
+                # filas cortas: las columnas que faltan quedan vacías (y se descartan al validar)
+                values = [pick(row) if len(row) >= len(header) else pick(row + padding)
+                          for row in itertools.islice(reader, CSV_CHUNK_ROWS) if row]
+                if not values:
+                    return
+                yield dict(zip(SCHEMA, zip(*values)))
+
+    def _ingested_chunks(self, limit):
+        """Bloques (dict de listas) de los primeros `limit` bytes del log de ingestas"""
+        if not limit or not os.path.exists(self.ingest_log_path):
+            return
+        with open(self.ingest_log_path, "rb") as f:
+            lines = f.read(limit).splitlines()
+        for start in range(0, len(lines), CSV_CHUNK_ROWS):
+            records = [json.loads(line) for line in lines[start:start + CSV_CHUNK_ROWS] if line.strip()]
+            yield {name: [record[name] for record in records] for name in SCHEMA}
+
+    def _committed_log_bytes(self, previous):
+        """Bytes del log confirmados por meta.json; sin almacén previo vale todo el archivo"""
+        if "ingest_log_bytes" in previous:
+            return previous["ingest_log_bytes"]
+        return os.path.getsize(self.ingest_log_path) if os.path.exists(self.ingest_log_path) else 0
+
+    def _convert_csv(self, previous):
+        """Conversión completa CSV -> columnas, por bloques y en un directorio temporal
+
+        Las filas del log de ingestas se agregan al final: sobreviven a cambios del CSV
+        """
+        tmp_dir = f"{self.store_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        source = self._source_stat()
+        cities, city_index, rows, rejected, sample = [], {}, 0, 0, []
+        files = {name: open(os.path.join(tmp_dir, f"{name}.bin"), "wb") for name in SCHEMA}
+        try:
+            for frame in self._csv_chunks():
+                encoded, valid = self._encode(frame, cities, city_index)
+                for name, f in files.items():
+                    f.write(encoded[name].tobytes())
+                if not sample:
+                    sample = self._decode_rows(encoded, cities, SAMPLE_ROWS)
+                kept = int(valid.sum())
+                rows += kept
+                rejected += len(valid) - kept
+            log_bytes = self._committed_log_bytes(previous)
+            ingested = 0
+            for frame in self._ingested_chunks(log_bytes):
+                encoded, valid = self._encode(frame, cities, city_index)
+                for name, f in files.items():
+                    f.write(encoded[name].tobytes())
+                ingested += int(valid.sum())
+            rows += ingested
+        finally:
+            for f in files.values():
+                f.close()
+
+        self._write_meta({
+            "format": STORE_FORMAT,
+            "tenant": self.key,
+            "rows": rows,
+            "version": previous.get("version", 0) + 1,
+            "build_id": f"{time.time_ns():x}",
+            "cities": cities,
+            "schema": SCHEMA,
+            "source": source,
+            "ingest_log_bytes": log_bytes,
+            "ingested_rows": ingested,
+            "rejected_rows": rejected,
+            "sample": sample,
+            "updated": datetime.now().isoformat()
+        }, tmp_dir)
+
+        # los lectores con columnas ya mapeadas siguen viendo los archivos anteriores
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+        os.replace(tmp_dir, self.store_dir)
+
+    def append(self, records):
+        """Ingesta append-only: añade filas sin reescribir las columnas existentes"""
+        records = list(records)
+        if not records:
+            return 0
+
+        frame = {name: [record[name] for record in records] for name in SCHEMA}
+        with self._lock, exclusive_lock(self.lock_path):
+            # meta.json se relee bajo el lock: otro proceso pudo haber ingerido filas
+            meta = self._read_meta()
+            cities = list(meta["cities"])
+            encoded, valid = self._encode(frame, cities, {city: code for code, city in enumerate(cities)})
+            records = [record for record, ok in zip(records, valid.tolist()) if ok]
+            if not records:
+                return 0
+            logged = "".join(json.dumps({name: record[name] for name in SCHEMA}, ensure_ascii=False) + "\n"
+                             for record in records).encode("utf-8")
+
+            # el log es la copia durable de las ingestas; igual que las columnas, se descarta
+            # lo que quedó de una ingesta previa que no llegó a confirmarse en meta.json
+            log_bytes = self._committed_log_bytes(meta)
+            with open(self.ingest_log_path, "r+b" if os.path.exists(self.ingest_log_path) else "wb") as f:
+                f.truncate(log_bytes)
+                f.seek(0, os.SEEK_END)
+                f.write(logged)
+                f.flush()
+                os.fsync(f.fileno())
+
+            for name in SCHEMA:
+                path = os.path.join(self.store_dir, f"{name}.bin")
+                itemsize = np.dtype(SCHEMA[name]).itemsize
+                with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                    # descarta bytes de una ingesta previa que no llegó a confirmarse
+                    f.truncate(meta["rows"] * itemsize)
+                    f.seek(0, os.SEEK_END)
+                    f.write(encoded[name].tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            meta.update({
+                "rows": meta["rows"] + len(records),
+                "version": meta["version"] + 1,
+                "ingest_log_bytes": log_bytes + len(logged),
+                "ingested_rows": meta.get("ingested_rows", 0) + len(records),
+                "cities": cities,
+                "sample": meta.get("sample") or self._decode_rows(encoded, cities, SAMPLE_ROWS),
+                "updated": datetime.now().isoformat()
+            })
+            self._write_meta(meta)
+            self._set_meta(meta)
+        return len(records)
+
+
+# --- REGISTRO DE DATASETS ---
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+
+def open_dataset(key):
+    """Devuelve el dataset del tenant (abierto una vez por proceso) con metadata al día"""
+    dataset = _datasets.get(key)
+    if dataset is None:
+        with _datasets_lock:
+            dataset = _datasets.get(key)
+            if dataset is None:
+                dataset = TenantDataset(key).open()
+                _datasets[key] = dataset
+        return dataset
+    dataset.refresh()
+    return dataset
+
+
+def forget_dataset(key):
+    """Olvida el dataset abierto para que la próxima apertura revise el CSV de inmediato"""
+    with _datasets_lock:
+        _datasets.pop(key, None)
@@ -0,0 +1,137 @@
+"""
+Caché de decisiones para /assess-credit.
+
+La clave combina el tenant, las versiones de su configuración y de su
+historial, y la forma canónica del solicitante y del préstamo. Cambiar los
+umbrales en el JSON de la institución o ingerir historial cambia la versión,
+así que las entradas viejas dejan de ser alcanzables y salen por LRU o TTL.
+Las peticiones idénticas concurrentes esperan el mismo cómputo (single-flight).
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+# --- CONFIGURACIÓN ---
+CACHE_TTL = 300.0                # segundos de vida de una decisión
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+MAX_CACHE_ENTRIES = 100_000
+ENTRY_OVERHEAD = 200             # bytes estimados por entrada además del resultado serializado
+
+
+def _optional_float(value):
+    return None if value is None else float(value)
+
+
+def canonical_request(request):
+    """Normaliza los campos que influyen en el scoring (el propósito del préstamo no influye)"""
+    applicant = request["applicant"]
+    return (
+        float(applicant["age"]),
+        float(applicant["monthly_income"]),
+        float(applicant["credit_score"]),
+        (applicant.get("city") or "").strip().lower(),
+        _optional_float(applicant.get("debt_to_income_ratio")),
+        _optional_float(applicant.get("late_payments")),
+        float(request["loan_amount"]),
+        int(request["loan_term_months"]),
+    )
+
+
+class DecisionCache:
+    """LRU + TTL con presupuesto de memoria y de-duplicación de cómputos en curso"""
+
+    def __init__(self, ttl=CACHE_TTL, max_bytes=MAX_CACHE_BYTES, max_entries=MAX_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()     # clave -> (expira, bytes, resultado)
+        self.bytes = 0
+        self.inflight = {}
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "not_cached": 0, "evictions": 0, "expired": 0}
+
+    def key(self, engine, request):
+        return (engine.tenant_id, engine.config_version, engine.dataset_version, canonical_request(request))
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            self.counters["expired"] += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry[2]
+
+    def put(self, key, result):
+        size = len(json.dumps(result, default=str)) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.monotonic() + self.ttl, size, result)
+        self.bytes += size
+        while self.bytes > self.max_bytes or len(self.entries) > self.max_entries:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.counters["evictions"] += 1
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    async def get_or_compute(self, key, compute, cacheable=None):
+        """Devuelve (resultado, "hit" | "miss" | "coalesced"); `compute` es una corutina sin argumentos"""
+        result = self.get(key)
+        if result is not None:
+            self.counters["hits"] += 1
+            return result, "hit"
+
+        task = self.inflight.get(key)
+        if task is None:
+            self.counters["misses"] += 1
+            status = "miss"
+            # el cómputo corre como tarea propia: si el primer cliente se desconecta, los demás no lo pierden
+            task = self.inflight[key] = asyncio.get_event_loop().create_task(self._compute(key, compute, cacheable))
+            task.add_done_callback(_retrieve_exception)
+        else:
+            self.counters["coalesced"] += 1
+            status = "coalesced"
+        return await asyncio.shield(task), status
+
+    async def _compute(self, key, compute, cacheable):
+        try:
+            result = await compute()
+            if cacheable is None or cacheable(result):
+                self.put(key, result)
+            else:
+                self.counters["not_cached"] += 1
+            return result
+        finally:
+            del self.inflight[key]
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+        return {
+            **self.counters,
+            "hit_rate": round((self.counters["hits"] + self.counters["coalesced"]) / lookups, 4) if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "inflight": len(self.inflight)
+        }
+
+
+def _retrieve_exception(task):
+    # evita el aviso de excepción no recuperada si todos los clientes se fueron
+    if not task.cancelled():
+        task.exception()
+
+
+decision_cache = DecisionCache()
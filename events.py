@@ -0,0 +1,209 @@
+"""
+Hub de eventos en vivo para los dashboards (Server-Sent Events).
+
+Las evaluaciones se registran en un canal por tenant y en el canal global
+"*". Una tarea en segundo plano arma, como máximo una vez por tick, una
+instantánea de cada canal con cambios (últimas decisiones, contadores y, en
+el global, el resumen de métricas), la serializa una sola vez y la deja en
+el buzón de cada suscriptor. El buzón guarda solo el último frame: un
+cliente lento recibe el estado más reciente en vez de acumular atrasos.
+
+Cada stream dura como máximo STREAM_MAX_AGE: uvicorn espera a que cierren
+las conexiones abiertas antes del shutdown de la app (flush de auditoría,
+cierre del pool), y EventSource se reconecta solo con el `retry:` enviado.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+# --- CONFIGURACIÓN ---
+GLOBAL_CHANNEL = "*"
+TICK_INTERVAL = 1.0              # frecuencia máxima de frames por canal
+METRICS_INTERVAL = 5.0           # cada cuánto se refresca el resumen de métricas sin decisiones nuevas
+HEARTBEAT_INTERVAL = 15.0        # comentario SSE para mantener vivas conexiones inactivas
+STREAM_MAX_AGE = 20.0            # cota de cuánto puede demorar un SIGTERM por un dashboard conectado
+RECENT_DECISIONS = 20
+MAX_TENANT_CHANNELS = 1000
+# identifica este proceso: `seq` vuelve a 1 al reiniciar y cada worker de uvicorn lleva el suyo
+BOOT_ID = f"{os.getpid():x}-{time.time_ns():x}"
+
+
+class Subscriber:
+    """Buzón de un cliente: un único frame pendiente que se sobrescribe"""
+
+    __slots__ = ("frame", "ready", "delivered", "coalesced")
+
+    def __init__(self, frame=None):
+        self.frame = frame
+        self.ready = asyncio.Event()
+        self.delivered = 0
+        self.coalesced = 0
+        if frame is not None:
+            self.ready.set()
+
+    def offer(self, frame):
+        if self.frame is not None:
+            self.coalesced += 1
+        self.frame = frame
+        self.ready.set()
+
+    def take(self):
+        frame, self.frame = self.frame, None
+        self.ready.clear()
+        self.delivered += 1
+        return frame
+
+
+class Channel:
+    """Estado agregado de un tenant (o del global) más sus suscriptores"""
+
+    def __init__(self, name):
+        self.name = name
+        self.recent = deque(maxlen=RECENT_DECISIONS)
+        self.counts = {}
+        self.total = 0
+        self.dirty = False
+        self.frame = None
+        self.frames = 0
+        self.subscribers = set()
+
+    def record(self, decision):
+        self.recent.appendleft(decision)
+        self.counts[decision["decision"]] = self.counts.get(decision["decision"], 0) + 1
+        self.total += 1
+        self.dirty = True
+
+    def snapshot(self, metrics_summary=None):
+        payload = {
+            "channel": self.name,
+            "boot_id": BOOT_ID,
+            "ts": datetime.now().isoformat(),
+            "total": self.total,
+            "decisions_by_type": self.counts,
+            "decisions": list(self.recent)
+        }
+        if metrics_summary is not None:
+            payload["metrics"] = metrics_summary
+        data = json.dumps(payload, ensure_ascii=False, default=str)
+        return f"event: update\nid: {self.total}\ndata: {data}\n\n".encode("utf-8")
+
+
+class EventHub:
+    """Canales por tenant con serialización única y fan-out coalescente"""
+
+    def __init__(self, tick=TICK_INTERVAL):
+        self.tick = tick
+        self.channels = {GLOBAL_CHANNEL: Channel(GLOBAL_CHANNEL)}
+        self.seq = 0
+        self.metrics_provider = None
+        self.closing = False
+        self._metrics_at = 0.0
+        self._task = None
+
+    def channel(self, name):
+        channel = self.channels.get(name)
+        if channel is None:
+            if len(self.channels) > MAX_TENANT_CHANNELS:
+                return None
+            channel = self.channels[name] = Channel(name)
+        return channel
+
+    # --- PUBLICACIÓN ---
+    def record(self, tenant_id, decision):
+        """Registra una decisión; no serializa nada hasta el próximo tick"""
+        self.seq += 1
+        decision = {"seq": self.seq, **decision}
+        self.channels[GLOBAL_CHANNEL].record(decision)
+        channel = self.channel(tenant_id)
+        if channel is not None:
+            channel.record(decision)
+
+    def publish(self, force_metrics=False):
+        now = time.monotonic()
+        refresh_metrics = force_metrics or now - self._metrics_at >= METRICS_INTERVAL
+        for channel in self.channels.values():
+            is_global = channel.name == GLOBAL_CHANNEL
+            if not channel.subscribers or not (channel.dirty or (is_global and refresh_metrics)):
+                continue
+            summary = None
+            if is_global and self.metrics_provider is not None:
+                summary = self.metrics_provider()
+                self._metrics_at = now
+            channel.frame = channel.snapshot(summary)
+            channel.frames += 1
+            channel.dirty = False
+            for subscriber in channel.subscribers:
+                subscriber.offer(channel.frame)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                self.publish()
+            except Exception as e:
+                print(f"Error publishing events: {e}")
+
+    # --- SUSCRIPCIÓN ---
+    async def stream(self, name=GLOBAL_CHANNEL, max_age=STREAM_MAX_AGE):
+        """Generador SSE de un cliente; arranca con el último frame del canal y termina a los `max_age` s"""
+        channel = self.channel(name) or self.channels[GLOBAL_CHANNEL]
+        if channel.frame is None:
+            summary = self.metrics_provider() if channel.name == GLOBAL_CHANNEL and self.metrics_provider else None
+            channel.frame = channel.snapshot(summary)
+        subscriber = Subscriber(channel.frame)
+        channel.subscribers.add(subscriber)
+        deadline = time.monotonic() + max_age
+        try:
+            yield f"retry: {int(self.tick * 3000)}\n\n".encode("utf-8")
+            while not self.closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), min(HEARTBEAT_INTERVAL, remaining))
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if self.closing:
+                    break
+                yield subscriber.take()
+        finally:
+            channel.subscribers.discard(subscriber)
+
+    # --- CICLO DE VIDA ---
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        # despierta a los streams abiertos para que terminen en vez de esperar su próximo frame
+        self.closing = True
+        for channel in self.channels.values():
+            for subscriber in channel.subscribers:
+                subscriber.ready.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        subscribers = [s for channel in self.channels.values() for s in channel.subscribers]
+        return {
+            "channels": len(self.channels),
+            "subscribers": len(subscribers),
+            "by_channel": {
+                name: {"subscribers": len(channel.subscribers), "frames": channel.frames}
+                for name, channel in self.channels.items() if channel.subscribers
+            },
+            "coalesced": sum(s.coalesced for s in subscribers)
+        }
+
+
+hub = EventHub()
@@ -0,0 +1,30 @@
+"""
+Lock exclusivo entre procesos sobre un archivo (fcntl.flock).
+
+Los workers de uvicorn comparten el almacén columnar y la bitácora de
+auditoría en disco; un threading.Lock solo ordena los hilos de un proceso.
+En plataformas sin fcntl el lock es un no-op y queda solo el de hilos.
+"""
+
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+
+@contextmanager
+def exclusive_lock(path):
+    """Bloquea hasta obtener el lock de `path` (se crea si no existe) y lo libera al salir"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
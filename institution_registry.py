@@ -0,0 +1,192 @@
+"""
+Registro en memoria de instituciones (tenants).
+
+Las configuraciones de ../config/institutions se parsean una sola vez y se
+indexan por institution_info.id y por nombre de archivo. Un barrido de
+`os.stat` (en segundo plano o como máximo cada REFRESH_INTERVAL segundos)
+recarga solo los archivos cuyo mtime/tamaño y hash cambiaron, y cada cambio
+incrementa `version` para que las cachés dependientes se invaliden.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+# --- CONFIGURACIÓN ---
+CONFIG_DIR = "../config/institutions"
+REFRESH_INTERVAL = 2.0
+
+
+class Institution:
+    """Configuración parseada de una institución más su huella en disco"""
+
+    __slots__ = ("key", "filename", "config", "mtime_ns", "size", "digest", "version")
+
+    def __init__(self, key, filename, config, mtime_ns, size, digest, version):
+        self.key = key
+        self.filename = filename
+        self.config = config
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.version = version
+
+    @property
+    def info(self):
+        return self.config.get("institution_info", {})
+
+    @property
+    def id(self):
+        return self.info.get("id", "unknown")
+
+    @property
+    def name(self):
+        return self.info.get("name", self.key)
+
+    @property
+    def risk_configuration(self):
+        return self.config.get("risk_configuration", {})
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.info.get("status", "active"),
+            "config_file": self.filename
+        }
+
+
+class InstitutionRegistry:
+    """Índice O(1) de instituciones con recarga incremental por cambios en disco"""
+
+    def __init__(self, config_dir=CONFIG_DIR, refresh_interval=REFRESH_INTERVAL):
+        self.config_dir = config_dir
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self.errors = {}
+        self._failed = {}             # clave -> (mtime_ns, size, digest) del último JSON inválido
+        self._by_key = {}
+        self._by_id = {}
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    # --- BARRIDO ---
+    def refresh(self):
+        """Barrido de stat; recarga solo lo que cambió. Devuelve True si hubo cambios"""
+        with self._lock:
+            current = dict(self._by_key)
+            seen = set()
+            changed = False
+
+            if os.path.isdir(self.config_dir):
+                with os.scandir(self.config_dir) as entries:
+                    for entry in entries:
+                        if not entry.name.endswith(".json") or not entry.is_file():
+                            continue
+                        key = entry.name[:-len(".json")]
+                        seen.add(key)
+                        stat = entry.stat()
+                        known = current.get(key)
+                        if known and (known.mtime_ns, known.size) == (stat.st_mtime_ns, stat.st_size):
+                            continue
+                        failed = self._failed.get(key)
+                        if failed and failed[:2] == (stat.st_mtime_ns, stat.st_size):
+                            # sigue roto y sin tocar: ni se relee ni se vuelve a reportar
+                            continue
+                        loaded = self._load(entry.path, key, entry.name, stat, known)
+                        if loaded is not None and loaded is not known:
+                            current[key] = loaded
+                            changed = True
+
+            for key in set(current) - seen:
+                del current[key]
+                self.errors.pop(key, None)
+                changed = True
+            for key in set(self._failed) - seen:
+                del self._failed[key]
+                self.errors.pop(key, None)
+
+            if changed:
+                self._by_key = current
+                self._by_id = {inst.id: inst for inst in current.values()}
+            self._last_sweep = time.monotonic()
+            return changed
+
+    def _load(self, path, key, filename, stat, known):
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        if known and known.digest == digest:
+            # solo cambió el mtime: se conserva la entrada y su versión
+            known.mtime_ns, known.size = stat.st_mtime_ns, stat.st_size
+            self._failed.pop(key, None)
+            self.errors.pop(key, None)
+            return known
+        failed = self._failed.get(key)
+        if failed and failed[2] == digest:
+            self._failed[key] = (stat.st_mtime_ns, stat.st_size, digest)
+            return known
+        try:
+            config = json.loads(raw.decode("utf-8-sig"))
+        except ValueError as e:
+            print(f"Error loading {filename}: {e}")
+            self.errors[key] = str(e)
+            # se recuerda la huella del archivo roto para no releerlo en cada barrido
+            self._failed[key] = (stat.st_mtime_ns, stat.st_size, digest)
+            return known
+        self._failed.pop(key, None)
+        self.errors.pop(key, None)
+        self.version += 1
+        return Institution(key, filename, config, stat.st_mtime_ns, stat.st_size, digest, self.version)
+
+    def ensure_fresh(self):
+        """Sin watcher activo, barre como máximo una vez por intervalo"""
+        if self._watcher is None and time.monotonic() - self._last_sweep >= self.refresh_interval:
+            self.refresh()
+
+    # --- CONSULTAS ---
+    def get(self, tenant_id):
+        """Busca por institution_info.id o por nombre de archivo"""
+        self.ensure_fresh()
+        return self._by_id.get(tenant_id) or self._by_key.get(tenant_id)
+
+    def resolve_key(self, tenant_id):
+        """Clave de archivo de la institución, o None si el tenant no está configurado"""
+        institution = self.get(tenant_id)
+        return institution.key if institution is not None else None
+
+    def list(self):
+        self.ensure_fresh()
+        return sorted(self._by_key.values(), key=lambda inst: inst.filename)
+
+    # --- WATCHER EN SEGUNDO PLANO ---
+    async def _watch(self):
+        while True:
+            try:
+                await run_in_threadpool(self.refresh)
+            except Exception as e:
+                print(f"Error refreshing institutions: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start_watcher(self):
+        if self._watcher is None:
+            self.refresh()
+            self._watcher = asyncio.get_event_loop().create_task(self._watch())
+
+    async def stop_watcher(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+
+registry = InstitutionRegistry()
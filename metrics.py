@@ -0,0 +1,340 @@
+"""
+Instrumentación ASGI: histogramas de latencia por ruta, tenant y status.
+
+El middleware corre en el hilo del event loop, así que los contadores se
+actualizan sin locks: cada petición cuesta un bisect sobre buckets fijos y
+un par de sumas. Expone /metrics (texto Prometheus) y /metrics/summary
+(JSON para el dashboard), más gauges de peticiones en vuelo y del retraso
+del event loop.
+"""
+
+import asyncio
+import time
+from bisect import bisect_left
+from collections import deque
+
+from fastapi.responses import PlainTextResponse
+
+# --- CONFIGURACIÓN ---
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+MONITOR_INTERVAL = 0.5         # segundos entre mediciones del retraso del event loop
+RATE_WINDOW = 60.0             # ventana (s) para el throughput reciente
+MAX_TENANT_LABELS = 100        # tenants distintos antes de agrupar el resto en "other"
+UNMATCHED_ROUTE = "<unmatched>"
+NO_TENANT = "-"
+UNKNOWN_TENANT = "unknown"     # X-Tenant-ID que no corresponde a ninguna institución
+
+
+class Histogram:
+    """Histograma de buckets fijos (conteos no acumulados; se acumulan al exportar)"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """Estimación por interpolación lineal dentro del bucket"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= target:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (target - seen) / c
+            seen += c
+        return self.bounds[-1]
+
+
+class MetricsRegistry:
+    """Contadores, histogramas y gauges del proceso"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.series = {}          # (route, method, tenant, status) -> Histogram
+        self.in_flight = 0
+        self.in_flight_by_tenant = {}
+        self.tenants = set()
+        self.loop_lag = Histogram(LAG_BUCKETS)
+        self.loop_lag_last = 0.0
+        self.loop_lag_max = 0.0
+        self.total = 0
+        self.snapshots = deque()  # (monotonic, total, {route: count}) para tasas recientes
+        self.summary_providers = {}
+        self.prometheus_providers = []
+        self.tenant_resolver = None   # X-Tenant-ID -> clave de la institución, o None si no existe
+        self._routes = {}
+        self._monitor = None
+
+    # --- REGISTRO POR PETICIÓN ---
+    def tenant_label(self, tenant):
+        if not tenant:
+            return NO_TENANT
+        if self.tenant_resolver is not None:
+            # el header no está autenticado: solo las instituciones reales ocupan etiquetas
+            tenant = self.tenant_resolver(tenant)
+            if tenant is None:
+                return UNKNOWN_TENANT
+        if tenant in self.tenants:
+            return tenant
+        if len(self.tenants) >= MAX_TENANT_LABELS:
+            return "other"
+        self.tenants.add(tenant)
+        return tenant
+
+    def route_label(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        label = self._routes.get(endpoint)
+        if label is None:
+            router = scope.get("router")
+            for route in getattr(router, "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    label = route.path
+                    break
+            label = self._routes[endpoint] = label or UNMATCHED_ROUTE
+        return label
+
+    def observe(self, route, method, tenant, status, seconds):
+        key = (route, method, tenant, status)
+        histogram = self.series.get(key)
+        if histogram is None:
+            histogram = self.series[key] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(seconds)
+        self.total += 1
+
+    # --- MONITOR DEL EVENT LOOP ---
+    async def _monitor_loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + MONITOR_INTERVAL
+            await asyncio.sleep(MONITOR_INTERVAL)
+            lag = max(0.0, loop.time() - expected)
+            self.loop_lag.observe(lag)
+            self.loop_lag_last = lag
+            self.loop_lag_max = max(self.loop_lag_max, lag)
+            self._snapshot()
+
+    def _snapshot(self):
+        now = time.monotonic()
+        by_route = {}
+        for (route, _, _, _), histogram in self.series.items():
+            by_route[route] = by_route.get(route, 0) + histogram.count
+        self.snapshots.append((now, self.total, by_route))
+        while self.snapshots and now - self.snapshots[0][0] > RATE_WINDOW:
+            self.snapshots.popleft()
+
+    def start_monitor(self):
+        if self._monitor is None:
+            self._monitor = asyncio.get_event_loop().create_task(self._monitor_loop())
+
+    async def stop_monitor(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+
+    # --- EXPORTACIÓN ---
+    def prometheus(self):
+        lines = [
+            "# HELP http_requests_total Peticiones HTTP atendidas",
+            "# TYPE http_requests_total counter",
+        ]
+        for (route, method, tenant, status), h in sorted(self.series.items()):
+            lines.append(f'http_requests_total{{{_labels(route, method, tenant, status)}}} {h.count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Latencia de peticiones HTTP",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (route, method, tenant, status), h in sorted(self.series.items()):
+            labels = _labels(route, method, tenant, status)
+            lines += _histogram_lines("http_request_duration_seconds", labels, h)
+
+        lines += [
+            "# HELP http_requests_in_flight Peticiones en curso",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+        ]
+        for tenant, value in sorted(self.in_flight_by_tenant.items()):
+            lines.append(f'http_requests_in_flight{{tenant="{_escape(tenant)}"}} {value}')
+
+        lines += [
+            "# HELP event_loop_lag_seconds Retraso del event loop respecto al intervalo del monitor",
+            "# TYPE event_loop_lag_seconds histogram",
+        ]
+        lines += _histogram_lines("event_loop_lag_seconds", "", self.loop_lag)
+        lines += [
+            "# TYPE event_loop_lag_last_seconds gauge",
+            f"event_loop_lag_last_seconds {self.loop_lag_last:.6f}",
+            "# TYPE process_start_time_seconds gauge",
+            f"process_start_time_seconds {self.started:.3f}",
+        ]
+        for provider in self.prometheus_providers:
+            lines += provider()
+        return "\n".join(lines) + "\n"
+
+    def _recent_rates(self):
+        if len(self.snapshots) < 2:
+            return None, {}
+        (t0, total0, routes0), (t1, total1, routes1) = self.snapshots[0], self.snapshots[-1]
+        elapsed = t1 - t0
+        if elapsed <= 0:
+            return None, {}
+        return (total1 - total0) / elapsed, {
+            route: (count - routes0.get(route, 0)) / elapsed for route, count in routes1.items()
+        }
+
+    def summary(self):
+        """Resumen JSON por ruta y tenant, pensado para el dashboard"""
+        uptime = time.time() - self.started
+        total_rate, route_rates = self._recent_rates()
+
+        routes, tenants = {}, {}
+        for (route, method, tenant, status), h in self.series.items():
+            entry = routes.setdefault(route, {"histogram": Histogram(LATENCY_BUCKETS), "errors": 0, "status": {}})
+            entry["histogram"].merge(h)
+            entry["status"][str(status)] = entry["status"].get(str(status), 0) + h.count
+            if status >= 500:
+                entry["errors"] += h.count
+            t = tenants.setdefault(tenant, {"requests": 0, "errors": 0})
+            t["requests"] += h.count
+            if status >= 500:
+                t["errors"] += h.count
+
+        for route, entry in routes.items():
+            h = entry.pop("histogram")
+            entry.update({
+                "requests": h.count,
+                "error_rate": round(entry["errors"] / h.count, 4) if h.count else 0.0,
+                "rps": round(route_rates.get(route, h.count / uptime if uptime > 0 else 0.0), 3),
+                "mean_ms": round(1000 * h.sum / h.count, 3) if h.count else 0.0,
+                "p50_ms": round(1000 * h.quantile(0.50), 3),
+                "p95_ms": round(1000 * h.quantile(0.95), 3),
+                "p99_ms": round(1000 * h.quantile(0.99), 3)
+            })
+
+        summary = {
+            "uptime_s": round(uptime, 1),
+            "requests": self.total,
+            "rps": round(total_rate if total_rate is not None else (self.total / uptime if uptime > 0 else 0.0), 3),
+            "in_flight": self.in_flight,
+            "event_loop_lag_ms": {
+                "last": round(self.loop_lag_last * 1000, 3),
+                "max": round(self.loop_lag_max * 1000, 3),
+                "p99": round(self.loop_lag.quantile(0.99) * 1000, 3)
+            },
+            "routes": routes,
+            "tenants": tenants
+        }
+        for name, provider in self.summary_providers.items():
+            summary[name] = provider()
+        return summary
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(route, method, tenant, status):
+    return f'route="{_escape(route)}",method="{method}",tenant="{_escape(tenant)}",status="{status}"'
+
+
+def _histogram_lines(name, labels, histogram):
+    sep = "," if labels else ""
+    lines, cumulative = [], 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {histogram.count}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{suffix} {histogram.count}")
+    return lines
+
+
+class MetricsMiddleware:
+    """Middleware ASGI puro (sin BaseHTTPMiddleware) para no romper respuestas en streaming"""
+
+    def __init__(self, app, registry=None):
+        self.app = app
+        self.registry = registry or metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        started = time.perf_counter()
+        tenant = NO_TENANT
+        for name, value in scope["headers"]:
+            if name == b"x-tenant-id":
+                tenant = registry.tenant_label(value.decode("latin-1"))
+                break
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        registry.in_flight += 1
+        registry.in_flight_by_tenant[tenant] = registry.in_flight_by_tenant.get(tenant, 0) + 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            registry.in_flight -= 1
+            registry.in_flight_by_tenant[tenant] -= 1
+            registry.observe(registry.route_label(scope), scope["method"], tenant, status,
+                             time.perf_counter() - started)
+
+
+metrics = MetricsRegistry()
+
+
+def install_metrics(app, registry=None):
+    """Añade el middleware, el monitor del event loop y los endpoints /metrics a una app"""
+    registry = registry or metrics
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.on_event("startup")
+    async def start_metrics_monitor():
+        registry.start_monitor()
+
+    @app.on_event("shutdown")
+    async def stop_metrics_monitor():
+        await registry.stop_monitor()
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def prometheus_metrics():
+        return PlainTextResponse(registry.prometheus(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/metrics/summary")
+    async def metrics_summary():
+        return registry.summary()
+
+    return registry
@@ -0,0 +1,314 @@
+"""
+Agregados de riesgo por tenant, mantenidos de forma incremental.
+
+Sobre las columnas memory-mapped de dataset_store se calculan una vez, con
+bincount vectorizado, conteos, morosos y sumas por ciudad, por banda de
+score_crediticio y por tramo de ingresos, más sketches de cuantiles de las
+distribuciones. Cuando el historial crece solo se procesan las filas nuevas;
+todos los agregados son sumables (mergeables), así que dos particiones del
+historial se combinan sin releerlo. /tenant/stats lee en O(grupos) y el
+scorer usa las tasas por banda como prior. Los agregados publicados no se
+modifican: cada sincronización arma un objeto nuevo y lo reemplaza de una
+vez, así que los lectores no necesitan lock.
+"""
+
+import math
+import threading
+import time
+
+import numpy as np
+
+from dataset_store import open_dataset
+
+# --- CONFIGURACIÓN ---
+SCORE_BANDS = (300, 500, 580, 670, 740, 800)            # límites inferiores de cada banda
+INCOME_BUCKETS = (0, 1_000_000, 2_000_000, 3_000_000, 5_000_000, 8_000_000, 12_000_000)
+SKETCH_RELATIVE_ACCURACY = 0.01                          # error relativo máximo de los cuantiles
+BAND_PRIOR_ROWS = 20.0                                   # filas virtuales con la tasa base al suavizar
+QUANTILES = (0.10, 0.25, 0.50, 0.75, 0.90)
+
+
+def _labels(bounds, fmt, inclusive):
+    """Etiquetas "inferior-superior" por tramo; el último queda abierto ("inferior+")"""
+    uppers = [upper - 1 if inclusive else upper for upper in bounds[1:]]
+    return [f"{fmt(lower)}-{fmt(upper)}" for lower, upper in zip(bounds, uppers)] + [f"{fmt(bounds[-1])}+"]
+
+
+SCORE_BAND_LABELS = _labels(SCORE_BANDS, str, inclusive=True)
+INCOME_BUCKET_LABELS = _labels(INCOME_BUCKETS, lambda v: f"{v / 1_000_000:g}M", inclusive=False)
+
+
+def score_band(score):
+    """Índice de banda para escalares o arrays de score_crediticio"""
+    return np.clip(np.searchsorted(SCORE_BANDS, score, side="right") - 1, 0, len(SCORE_BANDS) - 1)
+
+
+def income_bucket(income):
+    return np.clip(np.searchsorted(INCOME_BUCKETS, income, side="right") - 1, 0, len(INCOME_BUCKETS) - 1)
+
+
+class QuantileSketch:
+    """Sketch logarítmico (estilo DDSketch): cuantiles con error relativo acotado y merge exacto"""
+
+    __slots__ = ("gamma", "log_gamma", "bins", "zeros", "count", "sum", "min", "max")
+
+    def __init__(self, relative_accuracy=SKETCH_RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        if len(positive):
+            index, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64),
+                                      return_counts=True)
+            for i, c in zip(index.tolist(), counts.tolist()):
+                self.bins[i] = self.bins.get(i, 0) + c
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        for i, c in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + c
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen > rank:
+                # punto medio del bucket en escala relativa: error <= relative_accuracy
+                value = 2 * self.gamma ** i / (1 + self.gamma)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 2),
+            "min": self.min,
+            "max": self.max,
+            **{f"p{int(q * 100)}": round(self.quantile(q), 2) for q in QUANTILES}
+        }
+
+
+class GroupCounts:
+    """Conteos, morosos y sumas por grupo; crecen si aparecen grupos nuevos (ciudades)"""
+
+    __slots__ = ("rows", "defaults", "income_sum", "score_sum")
+
+    def __init__(self, size=0):
+        self.rows = np.zeros(size, dtype=np.int64)
+        self.defaults = np.zeros(size, dtype=np.int64)
+        self.income_sum = np.zeros(size, dtype=np.float64)
+        self.score_sum = np.zeros(size, dtype=np.float64)
+
+    def _grow(self, size):
+        if size > len(self.rows):
+            for name in self.__slots__:
+                current = getattr(self, name)
+                grown = np.zeros(size, dtype=current.dtype)
+                grown[:len(current)] = current
+                setattr(self, name, grown)
+
+    def update(self, groups, moroso, ingresos, score, size):
+        self._grow(size)
+        n = len(self.rows)
+        self.rows += np.bincount(groups, minlength=n)
+        self.defaults += np.bincount(groups, weights=moroso, minlength=n).astype(np.int64)
+        self.income_sum += np.bincount(groups, weights=ingresos, minlength=n)
+        self.score_sum += np.bincount(groups, weights=score, minlength=n)
+
+    def merge(self, other):
+        self._grow(len(other.rows))
+        for name in self.__slots__:
+            getattr(self, name)[:len(other.rows)] += getattr(other, name)
+
+    def rates(self, base_rate, prior_rows=BAND_PRIOR_ROWS):
+        """Tasa de morosidad por grupo suavizada hacia la tasa base"""
+        return (self.defaults + prior_rows * base_rate) / (self.rows + prior_rows)
+
+    def table(self, labels, base_rate):
+        smoothed = self.rates(base_rate)
+        out = []
+        for i, label in enumerate(labels):
+            rows = int(self.rows[i]) if i < len(self.rows) else 0
+            if not rows:
+                continue
+            out.append({
+                "group": label,
+                "rows": rows,
+                "defaults": int(self.defaults[i]),
+                "default_rate": round(int(self.defaults[i]) / rows, 4),
+                "smoothed_default_rate": round(float(smoothed[i]), 4),
+                "avg_income": round(float(self.income_sum[i]) / rows, 2),
+                "avg_score": round(float(self.score_sum[i]) / rows, 1)
+            })
+        return out
+
+
+class TenantAggregates:
+    """Agregados de un tenant sobre las filas [0, rows) de su almacén columnar"""
+
+    def __init__(self, key):
+        self.key = key
+        self.build_id = None
+        self.version = None
+        self.cities = []
+        self.updated = None
+        self.reset()
+
+    def reset(self):
+        self.cursor = 0        # filas del almacén ya procesadas (incluye las descartadas)
+        self.rows = 0
+        self.skipped = 0       # filas con valores no finitos: no entran a ningún agregado
+        self.defaults = 0
+        self.by_city = GroupCounts()
+        self.by_score_band = GroupCounts(len(SCORE_BANDS))
+        self.by_income_bucket = GroupCounts(len(INCOME_BUCKETS))
+        self.score = QuantileSketch()
+        self.score_defaulted = QuantileSketch()
+        self.income = QuantileSketch()
+
+    @property
+    def base_rate(self):
+        return self.defaults / self.rows if self.rows else 0.0
+
+    def sync(self, dataset):
+        """Procesa solo las filas nuevas; recalcula todo si el almacén se reconstruyó"""
+        if dataset.version == self.version:
+            return 0
+        if dataset.build_id != self.build_id or dataset.rows < self.cursor:
+            self.reset()
+            self.build_id = dataset.build_id
+        start = self.cursor
+        self.update(dataset.columns(), start, dataset.rows, dataset.cities)
+        self.version = dataset.version
+        self.updated = time.time()
+        return dataset.rows - start
+
+    def copy(self):
+        copied = TenantAggregates(self.key)
+        copied.merge(self)
+        copied.cursor = self.cursor
+        copied.build_id = self.build_id
+        copied.version = self.version
+        copied.updated = self.updated
+        return copied
+
+    def synced(self, dataset):
+        """Copia al día con el almacén (desde cero si se reconstruyó); `self` queda intacto"""
+        if dataset.build_id != self.build_id or dataset.rows < self.cursor:
+            fresh = TenantAggregates(self.key)
+        else:
+            fresh = self.copy()
+        fresh.sync(dataset)
+        return fresh
+
+    def update(self, columns, start, end, cities):
+        if end <= start:
+            self.cities = list(cities)
+            return
+        block = {name: np.asarray(column[start:end]) for name, column in columns.items()}
+        self.cursor = end
+        finite = np.isfinite(block["ingresos"].astype(np.float64))
+        if not finite.all():
+            self.skipped += int((~finite).sum())
+            block = {name: values[finite] for name, values in block.items()}
+        moroso = block["moroso"].astype(np.float64)
+        ingresos = block["ingresos"].astype(np.float64)
+        score = block["score_crediticio"].astype(np.float64)
+
+        self.cities = list(cities)
+        self.by_city.update(block["ciudad"].astype(np.int64), moroso, ingresos, score, len(self.cities))
+        self.by_score_band.update(score_band(score), moroso, ingresos, score, len(SCORE_BANDS))
+        self.by_income_bucket.update(income_bucket(ingresos), moroso, ingresos, score, len(INCOME_BUCKETS))
+        self.score.update(score)
+        self.score_defaulted.update(score[moroso > 0])
+        self.income.update(ingresos)
+        self.rows += len(moroso)
+        self.defaults += int(moroso.sum())
+
+    def merge(self, other):
+        """Combina los agregados de otra partición del historial (mismo diccionario de ciudades)"""
+        self.by_city.merge(other.by_city)
+        self.by_score_band.merge(other.by_score_band)
+        self.by_income_bucket.merge(other.by_income_bucket)
+        self.score.merge(other.score)
+        self.score_defaulted.merge(other.score_defaulted)
+        self.income.merge(other.income)
+        self.rows += other.rows
+        self.skipped += other.skipped
+        self.defaults += other.defaults
+        if len(other.cities) > len(self.cities):
+            self.cities = list(other.cities)
+
+    # --- PRIORS PARA EL SCORER ---
+    def score_band_prior(self, credit_score):
+        """Tasa suavizada de la banda de cada score (escalar o array), en O(1) por consulta"""
+        return self.by_score_band.rates(self.base_rate)[score_band(credit_score)]
+
+    # --- LECTURA ---
+    def summary(self):
+        return {
+            "rows": self.rows,
+            "defaults": self.defaults,
+            "skipped_rows": self.skipped,
+            "default_rate": round(self.base_rate, 4),
+            "dataset_version": self.version,
+            "by_city": self.by_city.table(self.cities, self.base_rate),
+            "by_score_band": self.by_score_band.table(SCORE_BAND_LABELS, self.base_rate),
+            "by_income_bucket": self.by_income_bucket.table(INCOME_BUCKET_LABELS, self.base_rate),
+            "distributions": {
+                "score_crediticio": self.score.summary(),
+                "score_crediticio_morosos": self.score_defaulted.summary(),
+                "ingresos": self.income.summary()
+            }
+        }
+
+
+# --- REGISTRO DE AGREGADOS ---
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+
+def get_aggregates(key):
+    """Agregados al día del tenant; si el historial creció solo se agregan las filas nuevas"""
+    dataset = open_dataset(key)
+    aggregates = _aggregates.get(key)
+    if aggregates is None or aggregates.version != dataset.version:
+        # el lock solo serializa a los que sincronizan; los lectores toman la referencia publicada
+        with _aggregates_lock:
+            aggregates = _aggregates.get(key)
+            if aggregates is None:
+                aggregates = _aggregates[key] = TenantAggregates(key).synced(dataset)
+            elif aggregates.version != dataset.version:
+                aggregates = _aggregates[key] = aggregates.synced(dataset)
+    return aggregates
+
+
+def tenant_stats(key):
+    """Resumen por grupos del tenant; O(grupos), sin releer el historial"""
+    return get_aggregates(key).summary()
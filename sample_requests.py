@@ -0,0 +1,35 @@
+"""
+Solicitudes de ejemplo compartidas por test_api.py y benchmark.py.
+
+Sin dependencias: el benchmark (solo httpx) no necesita `requests` instalado.
+"""
+
+TENANT_ID = "banco_demo"
+
+BAJO_RIESGO = {
+    "applicant": {
+        "age": 35,
+        "monthly_income": 8000000,
+        "credit_score": 780,
+        "city": "Bogotá",
+        "debt_to_income_ratio": 0.2,
+        "late_payments": 0
+    },
+    "loan_amount": 15000000,
+    "loan_term_months": 36,
+    "loan_purpose": "vivienda"
+}
+
+ALTO_RIESGO = {
+    "applicant": {
+        "age": 24,
+        "monthly_income": 1400000,
+        "credit_score": 540,
+        "city": "Pereira",
+        "debt_to_income_ratio": 0.8,
+        "late_payments": 8
+    },
+    "loan_amount": 20000000,
+    "loan_term_months": 60,
+    "loan_purpose": "consumo"
+}
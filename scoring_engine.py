@@ -0,0 +1,389 @@
+"""
+Motor de scoring por vecinos más cercanos para CrediFace Multi-Tenant API.
+
+Cada tenant carga su historial (ver dataset_store) una sola vez en una matriz
+NumPy normalizada; cada evaluación es una única pasada vectorizada (o una
+consulta a un KD-tree en historiales grandes) en lugar de recorrer filas.
+"""
+
+import math
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from dataset_store import DatasetNotFound, open_dataset
+from institution_registry import registry
+
+
+# --- CONFIGURACIÓN ---
+DEFAULT_RISK_CONFIGURATION = {
+    "auto_reject_threshold": 0.90,
+    "high_risk_threshold": 0.80,
+    "medium_risk_threshold": 0.65,
+    "low_risk_threshold": 0.35
+}
+
+DEFAULT_TOP_K = 15
+KD_TREE_MIN_ROWS = 200_000     # por debajo, una pasada matricial es más rápida
+KD_TREE_CANDIDATES = 4         # candidatos extra por vecino para reordenar por ciudad
+CITY_MISMATCH_PENALTY = 0.5    # distancia² añadida si la ciudad no coincide
+PRIOR_STRENGTH = 1.0           # peso del prior (tasa base del tenant) en el suavizado
+BATCH_MATRIX_BUDGET = 4_000_000  # celdas máximas de la matriz de distancias por bloque
+CITY_PRIOR_ROWS = 20.0         # filas virtuales con la tasa base al suavizar la tasa por ciudad
+FAR_FEATURE = 1e3              # coordenada (en desviaciones estándar) de filas con valores no finitos
+
+_cKDTree = False               # False: scipy aún no se intentó importar
+
+
+def _kd_tree_class():
+    """scipy es opcional y pesado: se importa solo cuando un historial necesita KD-tree"""
+    global _cKDTree
+    if _cKDTree is False:
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:  # sin scipy se usa siempre fuerza bruta
+            cKDTree = None
+        _cKDTree = cKDTree
+    return _cKDTree
+
+
+class TenantNotFound(LookupError):
+    """El tenant no tiene configuración o historial disponible"""
+
+
+# --- NIVELES DE RIESGO ---
+def classify_risk(risk_score, risk_configuration):
+    """Traduce un score de riesgo [0, 1] a (risk_level, decision) según los umbrales del tenant"""
+    thresholds = {**DEFAULT_RISK_CONFIGURATION, **(risk_configuration or {})}
+
+    if math.isnan(risk_score):
+        # toda comparación contra NaN es falsa: sin este corte un score inválido terminaría aprobado
+        return "RECHAZO_AUTOMATICO", "RECHAZADO"
+    if risk_score >= thresholds["auto_reject_threshold"]:
+        return "RECHAZO_AUTOMATICO", "RECHAZADO"
+    if risk_score >= thresholds["high_risk_threshold"]:
+        return "ALTO", "RECHAZADO"
+    if risk_score >= thresholds["medium_risk_threshold"]:
+        return "RIESGOSO", "EN_REVISION"
+    if risk_score >= thresholds["low_risk_threshold"]:
+        return "MEDIO", "APROBADO"
+    return "BAJO", "APROBADO"
+
+
+# --- MOTOR POR TENANT ---
+class TenantScoringEngine:
+    """Historial de un tenant precomputado como matriz de features normalizadas"""
+
+    def __init__(self, tenant_id, edad, ingresos, ciudad, score_crediticio, moroso,
+                 risk_configuration=None, institution_name=None, cities=None):
+        self.tenant_id = tenant_id
+        self.institution_name = institution_name or tenant_id
+        self.risk_configuration = {**DEFAULT_RISK_CONFIGURATION, **(risk_configuration or {})}
+
+        self._history = (edad, ingresos, score_crediticio)
+        # estadísticas que ignoran NaN: una fila dañada no debe volver NaN todas las normalizaciones
+        raw = self._raw_features()
+        finite = np.isfinite(raw).all(axis=1)
+        self.mean = raw[finite].mean(axis=0) if finite.any() else np.zeros(3)
+        std = raw[finite].std(axis=0) if finite.any() else np.ones(3)
+        self.std = np.where(std > 0, std, 1.0)
+
+        # la matriz normalizada y el KD-tree se construyen en el primer kNN (build_index): el proceso
+        # principal solo necesita estadísticas y tasas, el kNN interactivo corre en el pool de agentes
+        self.features = None
+        self.sq_norms = None
+        self.tree = None
+        self._index_lock = threading.Lock()
+        self.moroso = np.asarray(moroso)
+
+        # ciudad codificada como entero: la comparación por petición es un solo `!=`
+        if cities is None:
+            cities, ciudad = np.unique(np.asarray(ciudad, dtype=str), return_inverse=True)
+        self.cities = list(cities)
+        self.city_codes = np.asarray(ciudad, dtype=np.int32).reshape(-1)
+        self.city_index = {city.strip().lower(): code for code, city in enumerate(self.cities)}
+
+        self.rows = len(self.moroso)
+        self.base_rate = float(self.moroso.mean()) if self.rows else 0.0
+        self.city_rows = np.bincount(self.city_codes, minlength=len(self.cities))
+        self.city_defaults = np.bincount(self.city_codes, weights=self.moroso, minlength=len(self.cities))
+        self.config_version = None
+        self.dataset_version = None
+        self.loaded_at = datetime.now().isoformat()
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        """Construye el motor sobre las columnas memory-mapped del almacén del tenant"""
+        columns = dataset.columns()
+        engine = cls(
+            dataset.key,
+            columns["edad"],
+            columns["ingresos"],
+            columns["ciudad"],
+            columns["score_crediticio"],
+            columns["moroso"],
+            cities=dataset.cities,
+        )
+        engine.dataset_version = dataset.version
+        return engine
+
+    def apply_config(self, institution):
+        """Toma umbrales y nombre de la institución sin reconstruir la matriz"""
+        self.institution_name = institution.name
+        self.risk_configuration = {**DEFAULT_RISK_CONFIGURATION, **institution.risk_configuration}
+        self.config_version = institution.version
+
+    def _raw_features(self):
+        edad, ingresos, score_crediticio = self._history
+        return np.column_stack([
+            np.asarray(edad, dtype=np.float64),
+            np.log1p(np.asarray(ingresos, dtype=np.float64)),
+            np.asarray(score_crediticio, dtype=np.float64),
+        ])
+
+    def build_index(self):
+        """Construye la matriz de features (y el KD-tree en historiales grandes) una sola vez"""
+        if self.features is None:
+            with self._index_lock:
+                if self.features is None:
+                    features = np.ascontiguousarray((self._raw_features() - self.mean) / self.std, dtype=np.float32)
+                    # filas no finitas quedan lejos de toda consulta en vez de romper distancias y KD-tree
+                    features[~np.isfinite(features)] = FAR_FEATURE
+                    self.sq_norms = np.einsum("ij,ij->i", features, features)
+                    if self.rows >= KD_TREE_MIN_ROWS:
+                        kd_tree = _kd_tree_class()
+                        if kd_tree is not None:
+                            self.tree = kd_tree(features)
+                    self.features = features   # al final: marca el índice como listo
+        return self
+
+    @property
+    def index_type(self):
+        if self.features is None:
+            return "not_built"
+        return "kd_tree" if self.tree is not None else "brute_force"
+
+    def encode(self, age, monthly_income, credit_score):
+        """Normaliza solicitantes (escalares o arrays) con las estadísticas del historial"""
+        raw = np.column_stack([
+            np.asarray(age, dtype=np.float64).reshape(-1),
+            np.log1p(np.asarray(monthly_income, dtype=np.float64).reshape(-1)),
+            np.asarray(credit_score, dtype=np.float64).reshape(-1),
+        ])
+        return ((raw - self.mean) / self.std).astype(np.float32)
+
+    def city_code(self, city):
+        return self.city_index.get((city or "").strip().lower(), -1)
+
+    def city_rate(self, city):
+        """Tasa de morosidad de la ciudad, suavizada hacia la tasa base del tenant"""
+        return float(self.city_rates([city])[0])
+
+    def city_rates(self, cities):
+        """Tasas suavizadas de un bloque de ciudades; las desconocidas toman la tasa base"""
+        codes = np.fromiter((self.city_code(city) for city in cities), dtype=np.int64, count=len(cities))
+        known = codes >= 0
+        rates = np.full(len(codes), self.base_rate)
+        rates[known] = ((self.city_defaults[codes[known]] + CITY_PRIOR_ROWS * self.base_rate)
+                        / (self.city_rows[codes[known]] + CITY_PRIOR_ROWS))
+        return rates
+
+    def nearest(self, queries, city_codes, k=DEFAULT_TOP_K):
+        """Devuelve (índices, distancias²) de los k vecinos de cada consulta, ordenados"""
+        self.build_index()
+        queries = np.atleast_2d(queries)
+        city_codes = np.asarray(city_codes, dtype=np.int32).reshape(-1, 1)
+        k = min(k, self.rows)
+        if k == 0:
+            empty = (len(queries), 0)
+            return np.empty(empty, dtype=np.int64), np.empty(empty, dtype=np.float32)
+
+        if self.tree is not None:
+            candidates = min(k * KD_TREE_CANDIDATES, self.rows)
+            dist, idx = self.tree.query(queries, k=candidates)
+            idx = idx.reshape(len(queries), -1)
+            d2 = dist.reshape(len(queries), -1).astype(np.float32) ** 2
+            d2 += CITY_MISMATCH_PENALTY * (self.city_codes[idx] != city_codes)
+        else:
+            idx = None
+            # ||x - q||² = ||x||² - 2·x·q + ||q||²  -> un único producto de matrices
+            d2 = self.sq_norms - 2.0 * (queries @ self.features.T)
+            d2 += np.einsum("ij,ij->i", queries, queries)[:, None]
+            np.maximum(d2, 0.0, out=d2)
+            d2 += CITY_MISMATCH_PENALTY * (self.city_codes != city_codes)
+
+        if k < d2.shape[1]:
+            top = np.argpartition(d2, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(d2.shape[1]), d2.shape)
+        top_d2 = np.take_along_axis(d2, top, axis=1)
+        order = np.argsort(top_d2, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_d2 = np.take_along_axis(top_d2, order, axis=1)
+        return (top if idx is None else np.take_along_axis(idx, top, axis=1)), top_d2
+
+    def score(self, queries, city_codes, k=DEFAULT_TOP_K, prior=None):
+        """Scoring vectorizado de un bloque de solicitantes ya codificados"""
+        idx, d2 = self.nearest(queries, city_codes, k)
+        similarity = np.exp(-np.sqrt(d2))
+        defaults = self.moroso[idx]
+        weight = similarity.sum(axis=1)
+        weighted_defaults = (similarity * defaults).sum(axis=1)
+
+        prior = self.base_rate if prior is None else prior
+        risk_score = (weighted_defaults + PRIOR_STRENGTH * prior) / (weight + PRIOR_STRENGTH)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            similarity_score = np.where(weight > 0, 100.0 * weighted_defaults / weight, 0.0)
+        return {
+            "risk_score": risk_score,
+            "similarity_score": similarity_score,
+            "defaults": defaults.sum(axis=1),
+            "mean_similarity": similarity.mean(axis=1) if idx.shape[1] else np.zeros(len(idx)),
+            "k": idx.shape[1]
+        }
+
+    def assess(self, applicant, k=DEFAULT_TOP_K, prior=None):
+        """Evalúa un solicitante contra el historial del tenant"""
+        started = time.perf_counter()
+        query = self.encode(applicant["age"], applicant["monthly_income"], applicant["credit_score"])
+        scored = self.score(query, [self.city_code(applicant.get("city"))], k, prior)
+
+        risk_score = float(scored["risk_score"][0])
+        risk_level, decision = classify_risk(risk_score, self.risk_configuration)
+
+        return {
+            "risk_assessment": {
+                "decision": decision,
+                "risk_level": risk_level,
+                "risk_score": round(risk_score, 4),
+                "thresholds": self.risk_configuration
+            },
+            "similarity_score": round(float(scored["similarity_score"][0]), 2),
+            "neighbors": {
+                "k": int(scored["k"]),
+                "defaults": int(scored["defaults"][0]),
+                "mean_similarity": round(float(scored["mean_similarity"][0]), 4)
+            },
+            "engine": {
+                "index": self.index_type,
+                "history_rows": self.rows,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+            }
+        }
+
+    def score_batch(self, age, monthly_income, credit_score, cities, k=DEFAULT_TOP_K, prior=None):
+        """kNN de un bloque de solicitantes; devuelve (risk_score, similarity_score)"""
+        self.build_index()
+        queries = self.encode(age, monthly_income, credit_score)
+        city_codes = [self.city_code(city) for city in cities]
+
+        # en fuerza bruta la matriz consulta×historial se acota a BATCH_MATRIX_BUDGET celdas
+        step = len(queries) if self.tree is not None else max(1, BATCH_MATRIX_BUDGET // max(self.rows, 1))
+        risk_score = np.empty(len(queries), dtype=np.float64)
+        similarity_score = np.empty(len(queries), dtype=np.float64)
+        for start in range(0, len(queries), step):
+            block = slice(start, start + step)
+            block_prior = prior[block] if np.ndim(prior) else prior
+            scored = self.score(queries[block], city_codes[block], k, block_prior)
+            risk_score[block] = scored["risk_score"]
+            similarity_score[block] = scored["similarity_score"]
+        return risk_score, similarity_score
+
+    def assess_batch(self, age, monthly_income, credit_score, cities, k=DEFAULT_TOP_K, prior=None):
+        """Evalúa un bloque solo con kNN; devuelve (risk_score, similarity_score, niveles, decisiones)"""
+        risk_score, similarity_score = self.score_batch(age, monthly_income, credit_score, cities, k, prior)
+        levels, decisions = zip(*(classify_risk(r, self.risk_configuration) for r in risk_score)) \
+            if len(risk_score) else ((), ())
+        return risk_score, similarity_score, levels, decisions
+
+
+# --- REGISTRO DE MOTORES ---
+_engines = {}
+_engines_lock = threading.Lock()
+_rebuilding = set()
+_failed_versions = {}          # clave -> versión del historial cuya reconstrucción falló
+
+
+def resolve_tenant(tenant_id):
+    """Busca la institución del tenant en el registro en memoria"""
+    institution = registry.get(tenant_id)
+    if institution is None:
+        raise TenantNotFound(f"Institución '{tenant_id}' no configurada")
+    return institution
+
+
+def load_engine(institution):
+    """Construye el motor del tenant a partir de su configuración e historial"""
+    try:
+        dataset = open_dataset(institution.key)
+    except DatasetNotFound as e:
+        raise TenantNotFound(str(e))
+
+    engine = TenantScoringEngine.from_dataset(dataset)
+    engine.apply_config(institution)
+    return engine
+
+
+def get_engine(tenant_id):
+    """Devuelve el motor del tenant; si su historial cambió se reconstruye en segundo plano"""
+    institution = resolve_tenant(tenant_id)
+    engine = _engines.get(institution.key)
+    if engine is None:
+        # solo la primera carga bloquea: todavía no hay motor con el que responder
+        with _engines_lock:
+            engine = _engines.get(institution.key)
+            if engine is None:
+                engine = _engines[institution.key] = load_engine(institution)
+    else:
+        version = _dataset_version(institution.key)
+        if engine.dataset_version != version and _failed_versions.get(institution.key) != version:
+            _schedule_rebuild(institution)
+    if engine.config_version != institution.version:
+        # cambió el JSON de la institución: solo se actualizan umbrales y nombre
+        engine.apply_config(institution)
+    return engine
+
+
+def refresh_engine(tenant_id):
+    """Tras una ingesta: lanza la reconstrucción si el motor ya está cargado (no bloquea)"""
+    institution = registry.get(tenant_id)
+    if institution is not None and institution.key in _engines:
+        get_engine(institution.key)
+
+
+def _schedule_rebuild(institution):
+    with _engines_lock:
+        if institution.key in _rebuilding:
+            return
+        _rebuilding.add(institution.key)
+    threading.Thread(target=_rebuild, args=(institution,), name=f"engine-rebuild-{institution.key}",
+                     daemon=True).start()
+
+
+def _rebuild(institution):
+    """Construye el motor nuevo fuera de las peticiones y lo publica con una sola asignación"""
+    version = _dataset_version(institution.key)
+    try:
+        engine = load_engine(institution)
+        current = _engines.get(institution.key)
+        if current is not None and current.features is not None:
+            # donde ya se usaba el kNN (workers del pool) el reemplazo llega con el índice listo
+            engine.build_index()
+        # las evaluaciones en curso terminan con el motor anterior; las siguientes toman este
+        _engines[institution.key] = engine
+        _failed_versions.pop(institution.key, None)
+    except Exception as e:
+        print(f"Error rebuilding engine {institution.key}: {e}")
+        _failed_versions[institution.key] = version
+    finally:
+        with _engines_lock:
+            _rebuilding.discard(institution.key)
+
+
+def _dataset_version(key):
+    try:
+        return open_dataset(key).version
+    except DatasetNotFound:
+        return None
@@ -1,9 +1,33 @@
-﻿from fastapi import FastAPI, HTTPException
+﻿# primero: mide el tiempo de importación de toda la app desde aquí
+from startup import lazy_module, preload, startup
+
+import asyncio
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, confloat, conint, validator
+from typing import List, Optional
 import json
+import math
 import os
+import time
 from datetime import datetime
-import pandas as pd
+
+import batch_scoring
+from admission import BATCH_COST, BATCH_DEADLINE, INTERACTIVE_DEADLINE, AdmissionRejected, admission
+from agents import orchestrator
+from audit_log import audit
+from decision_cache import decision_cache
+from events import GLOBAL_CHANNEL, hub
+from institution_registry import registry
+from metrics import install_metrics
+from static_assets import StaticAssets
+
+# NumPy/pandas/SciPy se cargan en el primer uso (o en el calentamiento), no al importar la app
+dataset_store = lazy_module("dataset_store")
+risk_aggregates = lazy_module("risk_aggregates")
+scoring_engine = lazy_module("scoring_engine")
 
 # --- CONFIGURACIÓN DE APP ---
 app = FastAPI(
@@ -18,20 +42,113 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+metrics = install_metrics(app)
+metrics.tenant_resolver = registry.resolve_key
+metrics.summary_providers["audit"] = audit.stats
+metrics.summary_providers["agents"] = orchestrator.summary
+metrics.summary_providers["admission"] = admission.stats
+metrics.prometheus_providers.append(admission.prometheus)
+metrics.summary_providers["events"] = hub.stats
+metrics.summary_providers["decision_cache"] = decision_cache.stats
+metrics.summary_providers["startup"] = startup.stats
+hub.metrics_provider = metrics.summary
+
+assets = StaticAssets()
+assets.add("nadaki", "nadaki_dashboard.html")
+assets.add("multitenant", "dashboard.html")
+
+# --- CICLO DE VIDA ---
+@app.on_event("startup")
+async def start_registry():
+    # solo lo imprescindible: uvicorn no escucha hasta que terminan los handlers de startup
+    registry.start_watcher()
+    audit.start()
+    hub.start()
+    startup.warmup_task = asyncio.get_event_loop().create_task(warm_up())
+    startup.mark("listening")
+
+
+async def warm_up():
+    """Carga módulos pesados, historiales, índices y el pool de agentes; al final marca ready"""
+    with startup.phase("assets"):
+        await run_in_threadpool(assets.load_all)
+    with startup.phase("heavy_imports"):
+        await run_in_threadpool(preload, dataset_store, risk_aggregates, scoring_engine)
+    tenant_ids = [institution.key for institution in registry.list()]
+    for tenant_id in tenant_ids:
+        # un tenant con historial roto no bloquea la readiness del resto
+        with startup.phase(f"engine:{tenant_id}", critical=False):
+            await run_in_threadpool(scoring_engine.get_engine, tenant_id)
+            await run_in_threadpool(risk_aggregates.get_aggregates, tenant_id)
+    with startup.phase("agent_workers"):
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in orchestrator.start(tenant_ids)))
+    startup.set_ready()
+
+
+@app.on_event("shutdown")
+async def stop_registry():
+    if startup.warmup_task is not None and not startup.warmup_task.done():
+        startup.warmup_task.cancel()
+    await registry.stop_watcher()
+    await audit.stop()
+    orchestrator.stop()
+    await hub.stop()
 
 # --- ENDPOINT PRINCIPAL ---
+async def serve_asset(request, name):
+    try:
+        return await assets.response(request, name)
+    except Exception as e:
+        return HTMLResponse(f"<h1>Error cargando dashboard</h1><p>{e}</p>")
+
+
 @app.get("/")
-async def root():
-    return {
-        "message": "🚀 CrediFace Multi-Tenant API v2.0.0 - FUNCIONANDO!",
-        "status": "✅ ACTIVE",
-        "timestamp": datetime.now().isoformat(),
-        "phase": "FASE 1 - Infraestructura Multi-Tenant",
-        "note": "API funcionando - Motor ML pendiente por espacio en disco"
-    }
+@app.head("/")
+async def root(request: Request):
+    # los navegadores reciben el dashboard Nadaki; los clientes de la API, el JSON de estado.
+    # Vary: Accept para que un cache intermedio no sirva una variante a quien pidió la otra
+    if "text/html" in request.headers.get("accept", ""):
+        response = await serve_asset(request, "nadaki")
+    else:
+        response = JSONResponse({
+            "message": "🚀 CrediFace Multi-Tenant API v2.0.0 - FUNCIONANDO!",
+            "status": "✅ ACTIVE",
+            "timestamp": datetime.now().isoformat(),
+            "phase": "FASE 1 - Infraestructura Multi-Tenant",
+            "note": "API funcionando - Motor ML pendiente por espacio en disco"
+        })
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    return response
+
+@app.get("/dashboard", response_class=HTMLResponse)
+@app.head("/dashboard")
+async def multitenant_dashboard(request: Request):
+    return await serve_asset(request, "multitenant")
+
+
+@app.get("/api/demo")
+def demo():
+    return {"message": "Nadaki funcionando", "status": "success"}
+
+# --- ENDPOINTS DE SALUD ---
+@app.get("/health/live")
+@app.head("/health/live")
+async def liveness():
+    """El proceso responde; no depende del calentamiento"""
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/health/ready")
+@app.head("/health/ready")
+async def readiness():
+    """200 solo cuando configuraciones, historiales e índices ya están cargados"""
+    status = "ready" if startup.ready else "failed" if startup.failed else "warming_up"
+    body = {"status": status, **startup.stats()}
+    return JSONResponse(body, status_code=200 if startup.ready else 503)
+
 
-# --- ENDPOINT DE SALUD ---
 @app.get("/health")
+@app.head("/health")
 async def health_check():
     folders_to_check = {
         "config": "../config",
@@ -45,6 +162,7 @@ async def health_check():
     
     return {
         "status": "healthy",
+        "ready": startup.ready,
         "timestamp": datetime.now().isoformat(),
         "dependencies": {
             "fastapi": "✅ OK",
@@ -59,56 +177,274 @@ async def health_check():
 # --- ENDPOINT: LISTAR INSTITUCIONES ---
 @app.get("/institutions")
 async def list_institutions():
-    config_dir = "../config/institutions"
-    institutions = []
-    if os.path.exists(config_dir):
-        for filename in os.listdir(config_dir):
-            if filename.endswith(".json"):
-                try:
-                    with open(os.path.join(config_dir, filename), "r", encoding="utf-8") as f:
-                        config = json.load(f)
-                        institutions.append({
-                            "id": config.get("institution_info", {}).get("id", "unknown"),
-                            "name": config.get("institution_info", {}).get("name", filename.replace(".json", "")),
-                            "status": config.get("institution_info", {}).get("status", "active"),
-                            "config_file": filename
-                        })
-                except Exception as e:
-                    print(f"Error loading {filename}: {e}")
+    institutions = [institution.summary() for institution in registry.list()]
 
     return {
         "institutions": institutions,
         "count": len(institutions),
-        "config_dir": config_dir,
+        "config_dir": registry.config_dir,
+        "registry_version": registry.version,
         "timestamp": datetime.now().isoformat()
     }
 
 # --- ENDPOINT: PROBAR CARGA DE DATOS ---
 @app.get("/data-test")
 async def test_data():
-    banco_csv = "../data/banco_demo/historical_defaults.csv"
     results = {}
 
-    if os.path.exists(banco_csv):
+    for key in [institution.key for institution in registry.list()] or ["banco_demo"]:
         try:
-            df = pd.read_csv(banco_csv)
-            results["banco_demo"] = {
-                "status": "✅ CSV loaded",
-                "rows": len(df),
-                "columns": list(df.columns),
-                "sample": df.head(3).to_dict("records")
+            # la primera vez convierte el CSV; después solo lee metadata del almacén
+            dataset = await run_in_threadpool(dataset_store.open_dataset, key)
+            store = dataset.describe()
+            results[key] = {
+                "status": "✅ Store loaded",
+                "rows": store.pop("rows"),
+                "columns": store.pop("columns"),
+                "sample": store.pop("sample"),
+                "store": store
+            }
+        except dataset_store.DatasetNotFound:
+            results[key] = {
+                "status": "❌ CSV not found",
+                "path": os.path.join(dataset_store.DATA_DIR, key, dataset_store.HISTORY_FILENAME)
             }
         except Exception as e:
-            results["banco_demo"] = {"status": f"❌ Error loading CSV: {str(e)}"}
-    else:
-        results["banco_demo"] = {"status": "❌ CSV not found", "path": banco_csv}
+            results[key] = {"status": f"❌ Error loading data: {str(e)}"}
 
     return results
 
+# --- MODELOS DE EVALUACIÓN ---
+def finite(value):
+    # NaN/Infinity llegan como literales JSON válidos para json.loads y envenenan el scoring
+    if value is not None and not math.isfinite(value):
+        raise ValueError("debe ser un número finito")
+    return value
+
+
+class Applicant(BaseModel):
+    age: conint(ge=0)
+    monthly_income: confloat(ge=0)
+    credit_score: conint(ge=0)
+    city: str
+    debt_to_income_ratio: Optional[confloat(ge=0)] = None
+    late_payments: Optional[conint(ge=0)] = None
+
+    _finite = validator("monthly_income", "debt_to_income_ratio", allow_reuse=True)(finite)
+
+
+class CreditRequest(BaseModel):
+    applicant: Applicant
+    loan_amount: confloat(ge=0)
+    loan_term_months: conint(ge=1)
+    loan_purpose: Optional[str] = None
+
+    _finite = validator("loan_amount", allow_reuse=True)(finite)
+
+
+class HistoryRecord(BaseModel):
+    # los rangos caben en los dtypes del almacén columnar (edad/score <i2, moroso |i1)
+    edad: conint(ge=0, le=150)
+    ingresos: confloat(ge=0)
+    ciudad: str
+    score_crediticio: conint(ge=0, le=1000)
+    moroso: conint(ge=0, le=1)
+
+    _finite = validator("ingresos", allow_reuse=True)(finite)
+
+
+class HistoryIngest(BaseModel):
+    records: List[HistoryRecord]
+
+
+# --- RESOLUCIÓN DE TENANT ---
+def require_institution(tenant_id):
+    """Institución del tenant pedido o 400 (sin tenant) / 404 (no configurado)"""
+    if not tenant_id:
+        raise HTTPException(status_code=400, detail="Header X-Tenant-ID requerido")
+    institution = registry.get(tenant_id)
+    if institution is None:
+        raise HTTPException(status_code=404, detail=f"Institución '{tenant_id}' no configurada")
+    return institution
+
+# --- CONTROL DE ADMISIÓN ---
+async def admit(institution, cost=1.0, deadline=INTERACTIVE_DEADLINE):
+    """Reserva un slot de scoring para el tenant o responde 429/503 con Retry-After"""
+    try:
+        return await admission.acquire(institution.key, institution, cost, deadline)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail,
+                            headers={"Retry-After": str(e.retry_after)})
+
+def cacheable_decision(engine, result):
+    """Solo se cachean decisiones completas y calculadas sobre el historial de la clave"""
+    return all(
+        agent["status"] in ("ok", "no_data")
+        and (agent["detail"] or {}).get("dataset_version", engine.dataset_version) == engine.dataset_version
+        for agent in result["agents"]
+    )
+
+# --- ENDPOINT: EVALUACIÓN DE CRÉDITO ---
+@app.post("/assess-credit")
+async def assess_credit(request: CreditRequest, x_tenant_id: Optional[str] = Header(None)):
+    slot = await admit(require_institution(x_tenant_id))
+    started = time.perf_counter()
+    try:
+        try:
+            # la primera petición del tenant construye la matriz fuera del event loop
+            engine = await run_in_threadpool(scoring_engine.get_engine, x_tenant_id)
+        except scoring_engine.TenantNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+        # reenvíos idénticos (precalificación, ajuste de monto, envío final) reutilizan la decisión;
+        # los agentes corren en paralelo, cada uno acotado por su deadline
+        body = request.dict()
+        result, cache_status = await decision_cache.get_or_compute(
+            decision_cache.key(engine, body),
+            lambda: orchestrator.assess(engine, body),
+            cacheable=lambda result: cacheable_decision(engine, result)
+        )
+    finally:
+        admission.release(slot, time.perf_counter() - started)
+    # la entrada de caché guarda los tiempos de quien la calculó: se mide esta petición
+    # y las latencias de agentes reutilizadas quedan marcadas como cacheadas
+    result = {**result, "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)}
+    if cache_status == "hit":
+        result["agents"] = [{**agent, "cached": True} for agent in result["agents"]]
+    timestamp = datetime.now().isoformat()
+    audit.log({
+        "ts": timestamp,
+        "type": "assessment",
+        "tenant_id": x_tenant_id,
+        "request": body,
+        "decision": result["risk_assessment"]["decision"],
+        "risk_level": result["risk_assessment"]["risk_level"],
+        "risk_score": result["risk_assessment"]["risk_score"],
+        "similarity_score": result["similarity_score"],
+        "elapsed_ms": result["elapsed_ms"],
+        "cache": cache_status
+    })
+    hub.record(engine.tenant_id, {
+        "ts": timestamp,
+        "tenant_id": engine.tenant_id,
+        "institution": engine.institution_name,
+        "decision": result["risk_assessment"]["decision"],
+        "risk_level": result["risk_assessment"]["risk_level"],
+        "risk_score": result["risk_assessment"]["risk_score"],
+        "similarity_score": result["similarity_score"],
+        "loan_amount": request.loan_amount
+    })
+    return {
+        "tenant_id": x_tenant_id,
+        "institution": engine.institution_name,
+        **result,
+        "cache": cache_status,
+        "loan": {
+            "amount": request.loan_amount,
+            "term_months": request.loan_term_months,
+            "purpose": request.loan_purpose
+        },
+        "timestamp": timestamp
+    }
+
+# --- ENDPOINT: EVALUACIÓN MASIVA ---
+@app.post("/assess-credit/batch")
+async def assess_credit_batch(
+    request: Request,
+    x_tenant_id: Optional[str] = Header(None),
+    chunk_size: int = batch_scoring.DEFAULT_CHUNK_SIZE,
+    format: Optional[str] = None
+):
+    institution = require_institution(x_tenant_id)
+    if not 1 <= chunk_size <= batch_scoring.MAX_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"chunk_size debe estar entre 1 y {batch_scoring.MAX_CHUNK_SIZE}"
+        )
+
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format debe ser 'csv' o 'ndjson'")
+
+    # el lote ocupa un slot durante todo el stream y pesa BATCH_COST en la cola justa
+    slot = await admit(institution, BATCH_COST, BATCH_DEADLINE)
+    started = time.perf_counter()
+    try:
+        engine = await run_in_threadpool(scoring_engine.get_engine, x_tenant_id)
+        aggregates = await run_in_threadpool(risk_aggregates.get_aggregates, engine.tenant_id)
+    except scoring_engine.TenantNotFound as e:
+        admission.release(slot)
+        raise HTTPException(status_code=404, detail=str(e))
+    except BaseException:
+        # cualquier otro fallo (almacén ilegible, cancelación) también devuelve el slot
+        admission.release(slot)
+        raise
+
+    scored = batch_scoring.stream_assessments(
+        engine, request.stream(), fmt, chunk_size, audit, priors=aggregates.score_band_prior,
+        scorer=orchestrator.assess_batch
+    )
+    return StreamingResponse(admission.hold(scored, slot, started), media_type="application/x-ndjson")
+
+# --- ENDPOINT: EVENTOS EN VIVO ---
+@app.get("/events")
+async def live_events(tenant: Optional[str] = None, x_tenant_id: Optional[str] = Header(None)):
+    """Stream SSE con decisiones recientes y métricas; sin tenant se sigue el canal global"""
+    tenant_id = tenant or x_tenant_id
+    channel = require_institution(tenant_id).key if tenant_id else GLOBAL_CHANNEL
+
+    return StreamingResponse(
+        hub.stream(channel),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- ENDPOINT: INGESTA DE HISTORIAL ---
+@app.post("/tenant/history")
+async def ingest_history(batch: HistoryIngest, x_tenant_id: Optional[str] = Header(None)):
+    institution = require_institution(x_tenant_id)
+
+    try:
+        dataset = await run_in_threadpool(dataset_store.open_dataset, institution.key)
+    except dataset_store.DatasetNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    appended = await run_in_threadpool(dataset.append, [record.dict() for record in batch.records])
+    # el motor se reconstruye en segundo plano; mientras tanto se sigue evaluando con el anterior
+    await run_in_threadpool(scoring_engine.refresh_engine, institution.key)
+    return {
+        "status": "✅ Records appended",
+        "tenant_id": x_tenant_id,
+        "appended": appended,
+        "rows": dataset.rows,
+        "version": dataset.version,
+        "timestamp": datetime.now().isoformat()
+    }
+
+# --- ENDPOINT: ESTADÍSTICAS DE CARTERA ---
+@app.get("/tenant/stats")
+async def tenant_stats(x_tenant_id: Optional[str] = Header(None)):
+    institution = require_institution(x_tenant_id)
+
+    started = time.perf_counter()
+    try:
+        # agregados precalculados: solo se procesan las filas ingeridas desde la última lectura
+        stats = await run_in_threadpool(risk_aggregates.tenant_stats, institution.key)
+    except dataset_store.DatasetNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return {
+        "tenant_id": x_tenant_id,
+        "institution": institution.name,
+        **stats,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        "timestamp": datetime.now().isoformat()
+    }
+
 # --- ENDPOINT: CREAR CONFIGURACIÓN DE EJEMPLO ---
 @app.get("/create-sample-config")
 async def create_sample_config():
-    config_dir = "../config/institutions"
+    config_dir = registry.config_dir
     os.makedirs(config_dir, exist_ok=True)
 
     sample_config = {
@@ -126,6 +462,13 @@ async def create_sample_config():
             "medium_risk_threshold": 0.65,
             "low_risk_threshold": 0.35
         },
+        "admission_control": {
+            "rate_per_second": 100,
+            "burst": 200,
+            "max_concurrency": 16,
+            "max_queue": 100,
+            "weight": 1.0
+        },
         "ui_customization": {
             "primary_color": "#1976d2",
             "secondary_color": "#dc004e",
@@ -136,6 +479,7 @@ async def create_sample_config():
     config_path = os.path.join(config_dir, "banco_demo.json")
     with open(config_path, "w", encoding="utf-8") as f:
         json.dump(sample_config, f, indent=2, ensure_ascii=False)
+    registry.refresh()
 
     return {
         "status": "✅ Sample config created",
@@ -164,6 +508,7 @@ async def create_sample_data():
     csv_path = os.path.join(data_dir, "historical_defaults.csv")
     with open(csv_path, "w", encoding="utf-8") as f:
         f.write(csv_data)
+    dataset_store.forget_dataset("banco_demo")
 
     return {
         "status": "✅ Sample data created",
@@ -193,6 +538,8 @@ async def setup_all():
         ]
     }
 
+startup.mark("import")
+
 # --- EJECUCIÓN LOCAL ---
 if __name__ == "__main__":
     import uvicorn
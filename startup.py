@@ -0,0 +1,103 @@
+"""
+Arranque rápido: imports diferidos, calentamiento en segundo plano y readiness.
+
+El proceso debe aceptar conexiones cuanto antes (la plataforma escala a
+cero), así que los módulos pesados (NumPy, SciPy, pandas) se importan en el
+primer uso y la carga de configuraciones, historiales e índices corre como
+tarea de fondo después de que uvicorn empieza a escuchar. /health/live
+responde desde el primer instante; /health/ready solo cuando el
+calentamiento terminó sin errores en sus fases críticas (las de un solo
+tenant no cuentan). Cada fase queda medida en `startup.stats()`.
+"""
+
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- CONFIGURACIÓN ---
+IMPORT_STARTED = time.perf_counter()   # simple_api importa este módulo antes que nada
+
+
+class LazyModule:
+    """Proxy que importa el módulo real en el primer acceso a un atributo"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                started = time.perf_counter()
+                self._module = importlib.import_module(self._name)
+                startup.imports[self._name] = round((time.perf_counter() - started) * 1000, 3)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def preload(*modules):
+    """Fuerza la importación de proxies diferidos (se llama desde el threadpool al calentar)"""
+    for module in modules:
+        module._load()
+
+
+class StartupState:
+    """Fases del arranque con su duración, errores del calentamiento y estado de readiness"""
+
+    def __init__(self):
+        self.timeline = {}
+        self.phases = {}
+        self.imports = {}
+        self.errors = {}
+        self.failed = []             # fases críticas con error: el proceso nunca queda ready
+        self.ready = False
+        self.ready_at = None
+        self.warmup_task = None
+
+    def mark(self, name):
+        """Registra cuánto tardó el proceso en llegar a este punto"""
+        self.timeline[name] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 3)
+
+    @contextmanager
+    def phase(self, name, critical=True):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            print(f"Error during startup phase {name}: {e}")
+            self.errors[name] = str(e)
+            if critical:
+                self.failed.append(name)
+        finally:
+            self.phases[name] = round((time.perf_counter() - started) * 1000, 3)
+
+    def set_ready(self):
+        if self.failed:
+            print(f"Startup failed, not ready: {', '.join(self.failed)}")
+            return
+        self.ready = True
+        self.ready_at = datetime.now().isoformat()
+        self.mark("time_to_ready")
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "failed_phases": self.failed,
+            "ready_at": self.ready_at,
+            "timeline_ms": self.timeline,
+            "phases_ms": self.phases,
+            "lazy_imports_ms": self.imports,
+            "errors": self.errors
+        }
+
+
+startup = StartupState()
@@ -0,0 +1,154 @@
+"""
+Entrega de los dashboards HTML con variantes precomprimidas y validación de caché.
+
+Cada archivo se lee una vez al arrancar; en ese momento se calculan sus
+variantes gzip/brotli y un ETag fuerte. Las peticiones eligen la variante
+según Accept-Encoding, responden 304 ante If-None-Match y los HEAD no tocan
+el cuerpo. Un stat como máximo cada CHECK_INTERVAL segundos recarga el
+archivo si cambió en disco.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+from email.utils import formatdate
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # sin brotli se sirven solo gzip e identity
+    brotli = None
+
+# --- CONFIGURACIÓN ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECK_INTERVAL = 1.0
+CACHE_CONTROL = "no-cache"  # siempre revalidar: un deploy cambia el HTML sin cambiar la URL
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+class StaticAsset:
+    """Un archivo con sus variantes codificadas y ETags precalculados"""
+
+    def __init__(self, path, media_type):
+        self.path = path
+        self.media_type = media_type
+        self.stat_key = None
+        self.variants = {}
+        self.last_modified = None
+        self.tag = None
+        self.last_check = 0.0
+
+    def load(self):
+        stat = os.stat(self.path)
+        with open(self.path, "rb") as f:
+            body = f.read()
+
+        tag = hashlib.sha256(body).hexdigest()[:32]
+        variants = {"identity": (body, f'"{tag}"')}
+        variants["gzip"] = (gzip.compress(body, GZIP_LEVEL, mtime=0), f'"{tag}-gzip"')
+        if brotli is not None:
+            variants["br"] = (brotli.compress(body, quality=BROTLI_QUALITY), f'"{tag}-br"')
+
+        # se publica todo de una vez para que las peticiones concurrentes vean un estado coherente
+        self.variants = variants
+        self.tag = tag
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.stat_key = (stat.st_mtime_ns, stat.st_size)
+
+    def is_stale(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size) != self.stat_key
+
+    def matches(self, if_none_match):
+        """Comparación débil de If-None-Match contra cualquier variante del contenido actual"""
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate == "*":
+                return True
+            if candidate.startswith("W/"):
+                candidate = candidate[2:]
+            if candidate.strip('"').split("-")[0] == self.tag:
+                return True
+        return False
+
+
+def choose_encoding(accept_encoding, available):
+    """Elige br > gzip > identity respetando q=0 en Accept-Encoding"""
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+class StaticAssets:
+    """Conjunto de assets servidos desde memoria"""
+
+    def __init__(self, base_dir=BASE_DIR):
+        self.base_dir = base_dir
+        self.assets = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, filename, media_type="text/html"):
+        self.assets[name] = StaticAsset(os.path.join(self.base_dir, filename), media_type)
+
+    def load_all(self):
+        for asset in self.assets.values():
+            try:
+                asset.load()
+            except OSError as e:
+                print(f"Error loading {asset.path}: {e}")
+
+    def _reload_if_stale(self, asset):
+        with self._lock:
+            if asset.stat_key is None or asset.is_stale():
+                asset.load()
+
+    async def get(self, name):
+        """Devuelve el asset, recargándolo fuera del event loop si cambió en disco"""
+        asset = self.assets[name]
+        now = time.monotonic()
+        if asset.stat_key is None or now - asset.last_check >= CHECK_INTERVAL:
+            asset.last_check = now
+            await run_in_threadpool(self._reload_if_stale, asset)
+        return asset
+
+    async def response(self, request, name):
+        asset = await self.get(name)
+        encoding = choose_encoding(request.headers.get("accept-encoding"), asset.variants)
+        body, etag = asset.variants[encoding]
+
+        headers = {
+            "ETag": etag,
+            "Cache-Control": CACHE_CONTROL,
+            "Last-Modified": asset.last_modified,
+            "Vary": "Accept-Encoding"
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and asset.matches(if_none_match):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(len(body))
+        if request.method == "HEAD":
+            return Response(status_code=200, headers=headers, media_type=asset.media_type)
+        return Response(content=body, headers=headers, media_type=asset.media_type)
@@ -9,9 +9,10 @@ import json
 import time
 from datetime import datetime
 
+from sample_requests import ALTO_RIESGO, BAJO_RIESGO, TENANT_ID
+
 # Configuración
 BASE_URL = "http://localhost:8000"
-TENANT_ID = "banco_demo"
 
 def print_section(title):
     """Imprime una sección del test"""
@@ -69,6 +70,122 @@ def test_request(method, endpoint, data=None, headers=None, description=""):
         print(f"   ❌ Error: {str(e)}")
         return None
 
+def check(description, ok, detail=""):
+    """Imprime una verificación de humo y devuelve si pasó"""
+    print(f"   {'✅' if ok else '❌'} {description}" + (f" ({detail})" if detail else ""))
+    return ok
+
+def stream_request(endpoint, body, headers=None, description=""):
+    """POST con cuerpo crudo (NDJSON/CSV); devuelve (status, líneas JSON de la respuesta)"""
+    print(f"\n🔍 {description}")
+    print(f"   POST {endpoint}")
+    try:
+        response = requests.post(f"{BASE_URL}{endpoint}", data=body, headers=headers, stream=True)
+        print(f"   Status: {response.status_code}")
+        if response.status_code != 200:
+            print(f"   ❌ Error: {response.text}")
+            return response.status_code, []
+        return response.status_code, [json.loads(line) for line in response.iter_lines() if line]
+    except requests.exceptions.ConnectionError:
+        print(f"   ❌ Connection Error - ¿Está corriendo el servidor en {BASE_URL}?")
+        return None, []
+
+def test_batch(tenant_headers):
+    """Lote NDJSON con filas válidas e inválidas: cada fila tiene su resultado y al final un trailer"""
+    rows = [
+        json.dumps(BAJO_RIESGO),
+        json.dumps(ALTO_RIESGO["applicant"]),
+        '{"age": 30, "monthly_income": NaN, "credit_score": 700, "city": "Cali"}',
+        '{"age": 30, "monthly_income": -1, "credit_score": 700, "city": "Cali"}',
+        "esto no es json",
+    ]
+    status, lines = stream_request("/assess-credit/batch", "\n".join(rows) + "\n",
+                                   headers=tenant_headers, description="Lote NDJSON (2 válidas, 3 inválidas)")
+    if status != 200:
+        return
+    trailer = lines[-1] if lines else {}
+    check("Trailer al final del stream", trailer.get("type") == "trailer")
+    check("Una línea por registro", len(lines) == len(rows) + 1, f"{len(lines) - 1} de {len(rows)}")
+    check("Filas inválidas como errores", trailer.get("errors") == 3 and trailer.get("scored") == 2,
+          f"scored={trailer.get('scored')}, errors={trailer.get('errors')}")
+
+    single = requests.post(f"{BASE_URL}/assess-credit", json=BAJO_RIESGO, headers=tenant_headers)
+    if single.status_code == 200 and "decision" in lines[0]:
+        check("Misma decisión que /assess-credit", lines[0]["decision"] == single.json()["risk_assessment"]["decision"])
+
+    invalid = dict(BAJO_RIESGO, applicant=dict(BAJO_RIESGO["applicant"], monthly_income=-1))
+    response = requests.post(f"{BASE_URL}/assess-credit", json=invalid, headers=tenant_headers)
+    check("Ingreso negativo rechazado en /assess-credit", response.status_code == 422, f"status {response.status_code}")
+
+def test_history(tenant_headers):
+    """Ingesta de historial: el almacén crece y la versión cambia"""
+    record = {"edad": 35, "ingresos": 3200000, "score_crediticio": 710, "ciudad": "Medellín", "moroso": 0}
+    result = test_request("POST", "/tenant/history", data={"records": [record, record]},
+                          headers=tenant_headers, description="Ingesta de 2 registros")
+    if result:
+        check("Registros agregados", result.get("appended") == 2, f"rows={result.get('rows')}")
+    return result
+
+def test_stats(tenant_headers, history=None):
+    """Estadísticas de cartera: incluyen las filas recién ingeridas"""
+    result = test_request("GET", "/tenant/stats", headers=tenant_headers, description="Estadísticas de cartera")
+    if result:
+        check("Agregados por banda de score", bool(result.get("by_score_band")))
+        if history:
+            check("Incluye la ingesta reciente", result.get("rows") == history.get("rows"),
+                  f"{result.get('rows')} filas")
+
+def test_health():
+    """Probes de liveness y readiness; readiness espera al calentamiento"""
+    if test_request("GET", "/health/live", description="Liveness") is None:
+        return
+    for _ in range(30):
+        response = requests.get(f"{BASE_URL}/health/ready")
+        if response.json().get("status") != "warming_up":
+            break
+        time.sleep(1)
+    check("Readiness", response.status_code == 200, response.json().get("status"))
+
+def test_events(tenant_headers):
+    """Lee el primer frame SSE del canal del tenant (llega al conectar, sin esperar un tick)"""
+    print("\n🔍 Feed en vivo del tenant")
+    print("   GET /events")
+    try:
+        with requests.get(f"{BASE_URL}/events", headers=tenant_headers, stream=True, timeout=5) as response:
+            print(f"   Status: {response.status_code}")
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("data: "):
+                    frame = json.loads(line[len("data: "):])
+                    check("Frame con boot_id y decisiones", "boot_id" in frame and "decisions" in frame,
+                          f"{len(frame.get('decisions', []))} decisiones")
+                    return frame
+    except requests.exceptions.RequestException as e:
+        print(f"   ❌ Error: {e}")
+    return None
+
+def test_admission(tenant_headers):
+    """Control de admisión: tenant desconocido 404 y, terminado todo, ningún slot queda ocupado"""
+    response = requests.post(f"{BASE_URL}/assess-credit", json=BAJO_RIESGO, headers={"X-Tenant-ID": "no_existe"})
+    check("Tenant desconocido rechazado", response.status_code == 404, f"status {response.status_code}")
+    summary = test_request("GET", "/metrics/summary", description="Resumen de métricas")
+    if summary:
+        admission = summary.get("admission", {})
+        tenant = admission.get("tenants", {}).get(tenant_headers["X-Tenant-ID"], {})
+        check("Peticiones admitidas para el tenant", tenant.get("admitted", 0) > 0, f"{tenant.get('admitted')}")
+        check("Sin slots ocupados (lotes liberados)", admission.get("in_flight") == 0, f"in_flight={admission.get('in_flight')}")
+
+def test_decision_cache(tenant_headers):
+    """Dos envíos idénticos: el segundo reutiliza la decisión (si todos los agentes respondieron)"""
+    body = dict(BAJO_RIESGO, loan_amount=BAJO_RIESGO["loan_amount"] + int(time.time()) % 1000)
+    first = test_request("POST", "/assess-credit", data=body, headers=tenant_headers, description="Primer envío")
+    second = test_request("POST", "/assess-credit", data=body, headers=tenant_headers, description="Envío idéntico")
+    if first and second:
+        check("Segundo envío servido desde el cache", second.get("cache") == "hit",
+              f"{first.get('cache')} -> {second.get('cache')}")
+        check("Misma decisión", first["risk_assessment"] == second["risk_assessment"])
+        check("Latencias de agentes marcadas como cacheadas",
+              all(agent.get("cached") for agent in second.get("agents", [])))
+
 def main():
     """Ejecutar todos los tests"""
     
@@ -81,6 +198,7 @@ def main():
     print_section("TESTS BÁSICOS")
     test_request("GET", "/", description="Test del endpoint raíz")
     test_request("GET", "/health", description="Verificación de salud")
+    test_health()
     
     # Setup
     print_section("SETUP DEL SISTEMA")
@@ -99,38 +217,31 @@ def main():
     print_section("EVALUACIONES DE CRÉDITO")
     
     # Bajo riesgo
-    bajo_riesgo = {
-        "applicant": {
-            "age": 35,
-            "monthly_income": 8000000,
-            "credit_score": 780,
-            "city": "Bogotá",
-            "debt_to_income_ratio": 0.2,
-            "late_payments": 0
-        },
-        "loan_amount": 15000000,
-        "loan_term_months": 36,
-        "loan_purpose": "vivienda"
-    }
-    
-    result_bajo = test_request("POST", "/assess-credit", data=bajo_riesgo, headers=tenant_headers, description="BAJO RIESGO")
+    result_bajo = test_request("POST", "/assess-credit", data=BAJO_RIESGO, headers=tenant_headers, description="BAJO RIESGO")
     
     # Alto riesgo
-    alto_riesgo = {
-        "applicant": {
-            "age": 24,
-            "monthly_income": 1400000,
-            "credit_score": 540,
-            "city": "Pereira",
-            "debt_to_income_ratio": 0.8,
-            "late_payments": 8
-        },
-        "loan_amount": 20000000,
-        "loan_term_months": 60,
-        "loan_purpose": "consumo"
-    }
-    
-    result_alto = test_request("POST", "/assess-credit", data=alto_riesgo, headers=tenant_headers, description="ALTO RIESGO")
+    result_alto = test_request("POST", "/assess-credit", data=ALTO_RIESGO, headers=tenant_headers, description="ALTO RIESGO")
+
+    # Masivo
+    print_section("EVALUACIÓN MASIVA")
+    test_batch(tenant_headers)
+
+    # Cache de decisiones
+    print_section("CACHE DE DECISIONES")
+    test_decision_cache(tenant_headers)
+
+    # Historial
+    print_section("HISTORIAL DEL TENANT")
+    history = test_history(tenant_headers)
+    test_stats(tenant_headers, history)
+
+    # Eventos
+    print_section("FEED EN VIVO")
+    test_events(tenant_headers)
+
+    # Admisión
+    print_section("CONTROL DE ADMISIÓN")
+    test_admission(tenant_headers)
     
     # Resumen
     print_section("RESUMEN")